@@ -0,0 +1,30 @@
+"""add version counters
+
+Revision ID: 1a6d4c3f8b52
+Revises: f5c0a2b8e417
+Create Date: 2026-10-18 18:05:14.772910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a6d4c3f8b52'
+down_revision = 'f5c0a2b8e417'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('beatmaps', sa.Column('version', sa.Integer(), nullable=True, server_default="0"))
+    op.add_column('beatmaps', sa.Column('leaderboard_version', sa.Integer(), nullable=True, server_default="0"))
+    op.add_column('beatmapsets', sa.Column('version', sa.Integer(), nullable=True, server_default="0"))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('beatmapsets') as batch_op:
+        batch_op.drop_column('version')
+    with op.batch_alter_table('beatmaps') as batch_op:
+        batch_op.drop_column('leaderboard_version')
+        batch_op.drop_column('version')
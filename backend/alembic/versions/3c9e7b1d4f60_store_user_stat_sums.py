@@ -0,0 +1,44 @@
+"""store user stat sums
+
+Revision ID: 3c9e7b1d4f60
+Revises: b83e0d5f6a29
+Create Date: 2026-10-18 21:16:48.203715
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e7b1d4f60'
+down_revision = 'b83e0d5f6a29'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('key_accuracy_sum', sa.Float(), nullable=True))
+    op.add_column('users', sa.Column('kana_accuracy_sum', sa.Float(), nullable=True))
+    op.execute('''
+        UPDATE users SET
+            key_accuracy_sum = (SELECT coalesce(sum(key_accuracy), 0) FROM scores WHERE scores.user_id = users.id),
+            kana_accuracy_sum = (SELECT coalesce(sum(kana_accuracy), 0) FROM scores WHERE scores.user_id = users.id),
+            total_score = (SELECT coalesce(sum(score), 0) FROM scores WHERE scores.user_id = users.id),
+            play_count = (SELECT count(*) FROM scores WHERE scores.user_id = users.id)
+    ''')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('key_accuracy')
+        batch_op.drop_column('kana_accuracy')
+
+
+def downgrade() -> None:
+    op.add_column('users', sa.Column('key_accuracy', sa.Float(), nullable=True))
+    op.add_column('users', sa.Column('kana_accuracy', sa.Float(), nullable=True))
+    op.execute('''
+        UPDATE users SET
+            key_accuracy = CASE WHEN play_count > 0 THEN key_accuracy_sum / play_count ELSE 1 END,
+            kana_accuracy = CASE WHEN play_count > 0 THEN kana_accuracy_sum / play_count ELSE 1 END
+    ''')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('key_accuracy_sum')
+        batch_op.drop_column('kana_accuracy_sum')
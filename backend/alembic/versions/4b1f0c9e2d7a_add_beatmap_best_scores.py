@@ -0,0 +1,45 @@
+"""add beatmap_best_scores
+
+Revision ID: 4b1f0c9e2d7a
+Revises: 67fec9fbbc6b
+Create Date: 2026-10-18 10:12:41.503122
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b1f0c9e2d7a'
+down_revision = '67fec9fbbc6b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('beatmap_best_scores',
+        sa.Column('beatmap_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.String(length=69), nullable=False),
+        sa.Column('score_id', sa.Integer(), nullable=True),
+        sa.Column('score', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['beatmap_id'], ['beatmaps.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['score_id'], ['scores.id'], ),
+        sa.PrimaryKeyConstraint('beatmap_id', 'user_id')
+    )
+    op.create_index('ix_beatmap_best_scores_beatmap_id_score', 'beatmap_best_scores', ['beatmap_id', 'score'])
+    # same as models.rebuild_best_scores: highest score per (beatmap, user), earliest wins ties
+    op.execute('''
+        INSERT INTO beatmap_best_scores (beatmap_id, user_id, score_id, score)
+        SELECT beatmap_id, user_id, id, score FROM (
+            SELECT beatmap_id, user_id, id, score,
+                row_number() OVER (PARTITION BY beatmap_id, user_id ORDER BY score DESC, id) AS rank
+            FROM scores
+            WHERE beatmap_id IS NOT NULL AND user_id IS NOT NULL
+        ) WHERE rank = 1
+    ''')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_beatmap_best_scores_beatmap_id_score', table_name='beatmap_best_scores')
+    op.drop_table('beatmap_best_scores')
@@ -0,0 +1,27 @@
+"""add score ticket id
+
+Revision ID: 8f2d6a0c3e71
+Revises: 3c9e7b1d4f60
+Create Date: 2026-10-18 22:03:11.640952
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2d6a0c3e71'
+down_revision = '3c9e7b1d4f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('scores', sa.Column('ticket_id', sa.String(length=32), nullable=True))
+    op.create_index('ix_scores_ticket_id', 'scores', ['ticket_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_scores_ticket_id', 'scores')
+    with op.batch_alter_table('scores') as batch_op:
+        batch_op.drop_column('ticket_id')
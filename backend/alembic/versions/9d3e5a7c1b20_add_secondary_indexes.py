@@ -0,0 +1,36 @@
+"""add secondary indexes
+
+Revision ID: 9d3e5a7c1b20
+Revises: 4b1f0c9e2d7a
+Create Date: 2026-10-18 11:02:17.640281
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3e5a7c1b20'
+down_revision = '4b1f0c9e2d7a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # profile recent scores (rowid is implicitly the tail of the index, so this covers ORDER BY id)
+    op.create_index('ix_scores_user_id', 'scores', ['user_id'])
+    # per-user best on a map, rebuild_best_scores
+    op.create_index('ix_scores_beatmap_id_user_id_score', 'scores', ['beatmap_id', 'user_id', 'score'])
+    # diffs of a set
+    op.create_index('ix_beatmaps_beatmapset_id', 'beatmaps', ['beatmapset_id'])
+    # sets of an owner
+    op.create_index('ix_beatmapsets_owner_id', 'beatmapsets', ['owner_id'])
+    op.create_index('ix_replays_score_id', 'replays', ['score_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_replays_score_id', table_name='replays')
+    op.drop_index('ix_beatmapsets_owner_id', table_name='beatmapsets')
+    op.drop_index('ix_beatmaps_beatmapset_id', table_name='beatmaps')
+    op.drop_index('ix_scores_beatmap_id_user_id_score', table_name='scores')
+    op.drop_index('ix_scores_user_id', table_name='scores')
@@ -0,0 +1,59 @@
+"""add search index
+
+Revision ID: b83e0d5f6a29
+Revises: 1a6d4c3f8b52
+Create Date: 2026-10-18 19:42:31.508316
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b83e0d5f6a29'
+down_revision = '1a6d4c3f8b52'
+branch_labels = None
+depends_on = None
+
+# search.rebuild_search_index as of this revision, frozen against these tables
+# so later changes to the models or to search.py can't change what it does
+BEATMAP_COLUMNS = ['artist', 'title', 'artist_original', 'title_original', 'diffname']
+BEATMAPSET_COLUMNS = ['name', 'description'] + BEATMAP_COLUMNS
+
+beatmaps = sa.table('beatmaps', sa.column('id', sa.Integer), sa.column('beatmapset_id', sa.Integer),
+                    *[sa.column(c, sa.String) for c in BEATMAP_COLUMNS])
+beatmapsets = sa.table('beatmapsets', sa.column('id', sa.Integer),
+                       sa.column('name', sa.String), sa.column('description', sa.String))
+
+CJK = re.compile('([぀-ヿ㐀-䶿一-鿿豈-﫿ｦ-ﾟ])')
+
+
+def segment(s):
+    return CJK.sub(r' \1 ', s or '')
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    for table, columns in [('beatmap_search', BEATMAP_COLUMNS), ('beatmapset_search', BEATMAPSET_COLUMNS)]:
+        conn.execute(sa.text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5({', '.join(columns)}, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"))
+    beatmap_search = sa.table('beatmap_search', sa.column('rowid'), *map(sa.column, BEATMAP_COLUMNS))
+    beatmapset_search = sa.table('beatmapset_search', sa.column('rowid'), *map(sa.column, BEATMAPSET_COLUMNS))
+
+    diffs = {}
+    for row in conn.execute(sa.select(beatmaps)).fetchall():
+        conn.execute(beatmap_search.insert().values(rowid=row.id, **{ c: segment(getattr(row, c)) for c in BEATMAP_COLUMNS }))
+        diffs.setdefault(row.beatmapset_id, []).append(row)
+    for row in conn.execute(sa.select(beatmapsets)).fetchall():
+        values = { 'name': segment(row.name), 'description': segment(row.description) }
+        for c in BEATMAP_COLUMNS:
+            values[c] = ' '.join(segment(getattr(diff, c)) for diff in diffs.get(row.id, []))
+        conn.execute(beatmapset_search.insert().values(rowid=row.id, **values))
+
+
+def downgrade() -> None:
+    op.execute('DROP TABLE IF EXISTS beatmap_search')
+    op.execute('DROP TABLE IF EXISTS beatmapset_search')
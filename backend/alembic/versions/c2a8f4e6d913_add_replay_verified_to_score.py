@@ -0,0 +1,26 @@
+"""add replay_verified to score
+
+Revision ID: c2a8f4e6d913
+Revises: 9d3e5a7c1b20
+Create Date: 2026-10-18 13:41:05.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2a8f4e6d913'
+down_revision = '9d3e5a7c1b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # existing scores stay NULL (not checked)
+    op.add_column('scores', sa.Column('replay_verified', sa.Boolean(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('scores') as batch_op:
+        batch_op.drop_column('replay_verified')
@@ -0,0 +1,36 @@
+"""add user search index
+
+Revision ID: d4f7b2e9a618
+Revises: 8f2d6a0c3e71
+Create Date: 2026-10-18 23:14:52.207341
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f7b2e9a618'
+down_revision = '8f2d6a0c3e71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_name_nocase', 'users', [sa.text('name COLLATE NOCASE')])
+    # user_search.rebuild_user_search_index as of this revision, so later changes to it can't change this
+    op.execute('CREATE TABLE user_search_keys (rowid INTEGER PRIMARY KEY, user_id VARCHAR(69) NOT NULL UNIQUE)')
+    op.execute("CREATE VIRTUAL TABLE user_search USING fts5(name, tokenize='trigram')")
+    op.execute('INSERT INTO user_search_keys (user_id) SELECT id FROM users ORDER BY join_time, id')
+    op.execute('''
+        INSERT INTO user_search (rowid, name)
+        SELECT user_search_keys.rowid, coalesce(users.name, '') FROM user_search_keys
+        JOIN users ON users.id = user_search_keys.user_id
+    ''')
+    op.execute("INSERT INTO user_search (user_search) VALUES ('optimize')")
+
+
+def downgrade() -> None:
+    op.execute('DROP TABLE IF EXISTS user_search')
+    op.execute('DROP TABLE IF EXISTS user_search_keys')
+    op.drop_index('ix_users_name_nocase', table_name='users')
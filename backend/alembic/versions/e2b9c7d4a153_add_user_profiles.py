@@ -0,0 +1,110 @@
+"""add user profiles
+
+Revision ID: e2b9c7d4a153
+Revises: d4f7b2e9a618
+Create Date: 2026-10-19 00:37:05.918264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b9c7d4a153'
+down_revision = 'd4f7b2e9a618'
+branch_labels = None
+depends_on = None
+
+# the backfill is profiles.rebuild_profiles as of this revision, frozen against these tables
+# so later changes to the models or to profiles.py can't change what it does
+scores = sa.table('scores',
+    sa.column('id', sa.Integer),
+    sa.column('user_id', sa.String),
+    sa.column('beatmap_id', sa.Integer),
+    sa.column('score', sa.Integer),
+    sa.column('key_accuracy', sa.Float),
+    sa.column('kana_accuracy', sa.Float),
+    sa.column('time_unix', sa.Integer),
+    sa.column('speed_modification', sa.Float),
+    sa.column('mod_flag', sa.Integer),
+)
+beatmap_best_scores = sa.table('beatmap_best_scores',
+    sa.column('score_id', sa.Integer),
+    sa.column('play_count', sa.Integer),
+)
+user_profiles = sa.table('user_profiles',
+    sa.column('user_id', sa.String),
+    sa.column('summary', sa.JSON),
+)
+
+# profiles.py's defaults; `flask rebuild-profiles` applies other PROFILE_TOP_PLAYS/PROFILE_MOST_PLAYED
+TOP_PLAYS = 20
+MOST_PLAYED = 10
+# gameplayutils.get_grade
+GRADES = ['SS', 'S', 'A', 'B', 'C', 'D', 'E']
+GRADE_THRESHOLDS = [('S', 980000), ('A', 900000), ('B', 750000), ('C', 500000), ('D', 250000)]
+HIDDEN_MOD = 1
+
+
+def grade_of(row):
+    speed = row.speed_modification or 1
+    mult = speed ** 1.5 if speed < 1 else speed ** 0.4
+    if (row.mod_flag or 0) & HIDDEN_MOD:
+        mult *= 1.05
+    normalized_score = (row.score or 0) / mult if speed > 0 else 0
+    if normalized_score == 1000000:
+        return 'SS'
+    for grade, threshold in GRADE_THRESHOLDS:
+        if normalized_score >= threshold:
+            return grade
+    return 'E'
+
+
+def dump_score(row):
+    # as schemas.dump_scores_without_user
+    return {
+        'id': row.id, 'beatmap_id': row.beatmap_id, 'score': row.score,
+        'key_accuracy': row.key_accuracy, 'kana_accuracy': row.kana_accuracy, 'time_unix': row.time_unix,
+        'speed_modification': row.speed_modification, 'mod_flag': row.mod_flag,
+    }
+
+
+def build_summary(bests):
+    grade_counts = dict.fromkeys(GRADES, 0)
+    for row in bests:
+        grade_counts[grade_of(row)] += 1
+    top = sorted(bests, key=lambda row: (-row.score, row.id))[:TOP_PLAYS]
+    most_played = sorted(({ 'beatmap_id': row.beatmap_id, 'play_count': row.play_count } for row in bests),
+                         key=lambda entry: (-entry['play_count'], entry['beatmap_id']))[:MOST_PLAYED]
+    return { 'top_plays': [dump_score(row) for row in top], 'grade_counts': grade_counts, 'most_played': most_played }
+
+
+def upgrade() -> None:
+    op.add_column('beatmap_best_scores', sa.Column('play_count', sa.Integer(), nullable=True))
+    op.execute('''
+        UPDATE beatmap_best_scores SET play_count = (
+            SELECT count(*) FROM scores
+            WHERE scores.beatmap_id = beatmap_best_scores.beatmap_id AND scores.user_id = beatmap_best_scores.user_id)
+    ''')
+    op.create_index('ix_beatmap_best_scores_user_id', 'beatmap_best_scores', ['user_id'])
+    op.create_table('user_profiles',
+        sa.Column('user_id', sa.String(length=69), nullable=False),
+        sa.Column('summary', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    conn = op.get_bind()
+    bests = {}
+    for row in conn.execute(sa.select(scores, beatmap_best_scores.c.play_count)
+                            .join(beatmap_best_scores, beatmap_best_scores.c.score_id == scores.c.id)):
+        bests.setdefault(row.user_id, []).append(row)
+    if bests:
+        conn.execute(user_profiles.insert(), [{ 'user_id': user_id, 'summary': build_summary(user_bests) }
+                                              for user_id, user_bests in bests.items()])
+
+
+def downgrade() -> None:
+    op.drop_table('user_profiles')
+    op.drop_index('ix_beatmap_best_scores_user_id', table_name='beatmap_best_scores')
+    with op.batch_alter_table('beatmap_best_scores') as batch_op:
+        batch_op.drop_column('play_count')
@@ -0,0 +1,41 @@
+"""encode replays as v2
+
+Revision ID: e71b3d9a05c4
+Revises: c2a8f4e6d913
+Create Date: 2026-10-18 15:20:33.918406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from replayutils import encode_replay, decode_replay, is_v2
+
+
+# revision identifiers, used by Alembic.
+revision = 'e71b3d9a05c4'
+down_revision = 'c2a8f4e6d913'
+branch_labels = None
+depends_on = None
+
+replays = sa.table('replays', sa.column('id', sa.Integer), sa.column('data', sa.LargeBinary))
+
+
+def recode(convert):
+    conn = op.get_bind()
+    # raw values: rows can be text or bytes depending on which side of the migration they're on
+    rows = conn.exec_driver_sql('SELECT id, data FROM replays WHERE data IS NOT NULL').fetchall()
+    for id, data in rows:
+        conn.execute(replays.update().where(replays.c.id == id).values(data=convert(data)))
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('replays') as batch_op:
+        batch_op.alter_column('data', type_=sa.LargeBinary(), existing_type=sa.UnicodeText())
+    recode(lambda data: data if is_v2(data) else encode_replay(decode_replay(data)))
+
+
+def downgrade() -> None:
+    recode(lambda data: decode_replay(data).encode())
+    with op.batch_alter_table('replays') as batch_op:
+        batch_op.alter_column('data', type_=sa.UnicodeText(), existing_type=sa.LargeBinary())
+    op.execute('UPDATE replays SET data = CAST(data AS TEXT)')
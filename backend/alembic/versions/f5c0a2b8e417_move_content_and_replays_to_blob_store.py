@@ -0,0 +1,110 @@
+"""move content and replays to blob store
+
+Revision ID: f5c0a2b8e417
+Revises: e71b3d9a05c4
+Create Date: 2026-10-18 16:47:52.301877
+
+"""
+from hashlib import sha256
+import os
+import tempfile
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5c0a2b8e417'
+down_revision = 'e71b3d9a05c4'
+branch_labels = None
+depends_on = None
+
+# blobstore.py's layout as of this revision, so later changes to it can't change what this writes
+BLOB_DIR = os.environ.get('BLOB_DIR', 'persistent/blobs')
+
+
+def blob_path(blob_hash):
+    return os.path.join(BLOB_DIR, blob_hash[:2], blob_hash)
+
+
+def put_blob(data):
+    blob_hash = sha256(data).hexdigest()
+    path = blob_path(blob_hash)
+    if os.path.exists(path):
+        return blob_hash
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return blob_hash
+
+
+def get_blob(blob_hash):
+    with open(blob_path(blob_hash), 'rb') as f:
+        return f.read()
+
+beatmaps = sa.table('beatmaps',
+    sa.column('id', sa.Integer),
+    sa.column('content', sa.UnicodeText),
+    sa.column('content_hash', sa.String),
+    sa.column('content_length', sa.Integer),
+)
+replays = sa.table('replays',
+    sa.column('id', sa.Integer),
+    sa.column('data', sa.LargeBinary),
+    sa.column('data_hash', sa.String),
+    sa.column('data_length', sa.Integer),
+)
+
+
+def upgrade() -> None:
+    op.add_column('beatmaps', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('beatmaps', sa.Column('content_length', sa.Integer(), nullable=True))
+    op.add_column('replays', sa.Column('data_hash', sa.String(length=64), nullable=True))
+    op.add_column('replays', sa.Column('data_length', sa.Integer(), nullable=True))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(beatmaps.c.id, beatmaps.c.content).where(beatmaps.c.content.isnot(None))).fetchall()
+    for id, content in rows:
+        data = content.encode()
+        conn.execute(beatmaps.update().where(beatmaps.c.id == id)
+                     .values(content_hash=put_blob(data), content_length=len(data)))
+    rows = conn.execute(sa.select(replays.c.id, replays.c.data).where(replays.c.data.isnot(None))).fetchall()
+    for id, data in rows:
+        conn.execute(replays.update().where(replays.c.id == id)
+                     .values(data_hash=put_blob(data), data_length=len(data)))
+
+    with op.batch_alter_table('beatmaps') as batch_op:
+        batch_op.drop_column('content')
+    with op.batch_alter_table('replays') as batch_op:
+        batch_op.drop_column('data')
+
+
+def downgrade() -> None:
+    # blobs are left in place; `flask gc-blobs` cleans them up
+    op.add_column('beatmaps', sa.Column('content', sa.UnicodeText(), nullable=True))
+    op.add_column('replays', sa.Column('data', sa.LargeBinary(), nullable=True))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(beatmaps.c.id, beatmaps.c.content_hash).where(beatmaps.c.content_hash.isnot(None))).fetchall()
+    for id, content_hash in rows:
+        conn.execute(beatmaps.update().where(beatmaps.c.id == id)
+                     .values(content=get_blob(content_hash).decode()))
+    rows = conn.execute(sa.select(replays.c.id, replays.c.data_hash).where(replays.c.data_hash.isnot(None))).fetchall()
+    for id, data_hash in rows:
+        conn.execute(replays.update().where(replays.c.id == id).values(data=get_blob(data_hash)))
+
+    with op.batch_alter_table('beatmaps') as batch_op:
+        batch_op.drop_column('content_length')
+        batch_op.drop_column('content_hash')
+    with op.batch_alter_table('replays') as batch_op:
+        batch_op.drop_column('data_length')
+        batch_op.drop_column('data_hash')
@@ -1,16 +1,35 @@
-from flask import Blueprint, abort, request, session
-from functools import wraps
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from flask import Blueprint, abort, make_response, request, session
+from functools import partial, wraps
+from hashlib import sha1
+import json
+import os
 from marshmallow import ValidationError
 from operator import itemgetter
-from sqlalchemy import func, and_
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, noload, selectinload
 from time import time
 
-from models import Beatmap, Beatmapset, Score, User, Replay
-from schemas import beatmap_schema, beatmaps_schema, beatmapset_schema, beatmapsets_schema, \
-                    score_schema, scores_schema, scores_without_user_schema, replay_schema, user_schema, users_schema, user_stats_schema
-from database import db_session
+from beatmaputils import get_parsed_beatmap
+from cache import response_cache
+from compression import COMPRESSION_MIN_SIZE, accepted_encoding, compress, compress_response, set_encoding
+from models import Beatmap, Beatmapset, BeatmapBestScore, Score, User, Replay
+from schemas import beatmap_schema, beatmapset_schema, new_score_schema, dump_beatmap, dump_beatmaps, dump_beatmapset, \
+                    dump_beatmapsets, dump_score, dump_scores, dump_scores_without_user, dump_user, dump_users, dump_user_stats
+from database import db_session, read_only
+from search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, search_beatmaps, search_beatmapsets
+from user_search import search_users
+from profiles import empty_summary, rebuild_profiles, update_profile
+from verification import VERIFICATION_MODE, VERIFICATION_TIMEOUT, submit_verification
+from rankings import rankings
+from ingest import SCORE_INGESTION, enqueue, get_ticket, start_consumer
+from writer import run_write, submit
 
 MAX_NUM_SCORES = 50
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# GET /api/cache is for operators, so it's off (404) unless STATS_ENDPOINTS=1
+STATS_ENDPOINTS = os.environ.get('STATS_ENDPOINTS') == '1'
 
 api = Blueprint('api', __name__)
 
@@ -23,10 +42,322 @@ def login_required(f):
         return f(user['id'], *args, **kwargs)
     return wrapper
 
+def etagged(get_etag, cache_group=None):
+    '''
+    answers 304 Not Modified when If-None-Match has the current ETag, skipping the view entirely
+    get_etag takes the view's arguments and should be cheap; None means don't tag (e.g. 404)
+    with cache_group (view's arguments -> response_cache group), 200 bodies are also cached under their ETag,
+    compressed ones under ETag.encoding, so other clients asking for the same version skip the view too
+    '''
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            etag = get_etag(*args, **kwargs)
+            if etag is not None and request.if_none_match.contains_weak(etag):
+                res = make_response('', 304)
+                res.set_etag(etag)
+                return res
+            if etag is None or cache_group is None:
+                res = make_response(f(*args, **kwargs))
+                if etag is not None and res.status_code == 200:
+                    res.set_etag(etag)
+                return res
+            encoding = accepted_encoding()
+            # one hit or miss per request, by whether the body had to be built
+            if encoding is not None:
+                compressed = response_cache.get(f'{etag}.{encoding}', count=False)
+                if compressed is not None:
+                    response_cache.count(hit=True)
+                    return cached_response(compressed, etag, encoding, 'HIT')
+            body = response_cache.get(etag)
+            status = 'HIT'
+            if body is None:
+                res = make_response(f(*args, **kwargs))
+                if res.status_code != 200:
+                    return res
+                body = res.get_data()
+                response_cache.set(etag, body, cache_group(*args, **kwargs))
+                status = 'MISS'
+            if encoding is None or len(body) < COMPRESSION_MIN_SIZE:
+                return cached_response(body, etag, None, status)
+            compressed = compress(body, encoding)
+            response_cache.set(f'{etag}.{encoding}', compressed, cache_group(*args, **kwargs))
+            return cached_response(compressed, etag, encoding, status)
+        return wrapper
+    return decorator
+
+def cached_response(body, etag, encoding, status):
+    res = make_response(body)
+    res.mimetype = 'application/json'
+    res.set_etag(etag)
+    if len(body) >= COMPRESSION_MIN_SIZE or encoding is not None:
+        res.vary.add('Accept-Encoding')
+    if encoding is not None:
+        set_encoding(res, encoding)
+    res.headers['X-Cache'] = status
+    return res
+
+def make_etag(*parts):
+    return sha1('|'.join(map(str, parts)).encode()).hexdigest()
+
+def beatmap_etag(beatmap_id):
+    versions = db_session.query(Beatmap.version, Beatmap.content_hash, Beatmap.leaderboard_version, Beatmapset.version) \
+            .outerjoin(Beatmapset, Beatmapset.id == Beatmap.beatmapset_id) \
+            .filter(Beatmap.id == beatmap_id).one_or_none()
+    if versions is None:
+        return None
+    return make_etag('beatmap', beatmap_id, request.args.get('format'), *versions)
+
+def beatmapset_etag(beatmapset_id):
+    version = db_session.query(Beatmapset.version).filter(Beatmapset.id == beatmapset_id).scalar()
+    if version is None:
+        return None
+    return make_etag('beatmapset', beatmapset_id, version)
+
+def beatmap_cache_group(beatmap_id):
+    return f'beatmap:{beatmap_id}'
+
+def beatmapset_cache_group(beatmapset_id):
+    return f'beatmapset:{beatmapset_id}'
+
+def invalidate_cached_beatmapset(beatmapset):
+    '''
+    drops the cached responses that show beatmapset: its own and every diff's, which include the mapset
+    '''
+    if beatmapset is not None:
+        response_cache.invalidate(beatmapset_cache_group(beatmapset.id),
+                                  *(beatmap_cache_group(beatmap.id) for beatmap in beatmapset.beatmaps))
+
+def bump_version(*objs):
+    for obj in objs:
+        if obj is not None:
+            obj.version = type(obj).version + 1
+
 def process_beatmap(beatmap):
     source = f"https://www.youtube.com/watch?v={beatmap['yt_id']}"
     return { **beatmap, 'source' : source }
 
+# loader options matching what each schema dumps, so nested fields don't lazy load once per row
+# BeatmapSchema.scores is a single Nested over a list and always dumps as {}, so it's never worth loading
+BEATMAP_LOAD = (noload(Beatmap.scores),)
+BEATMAPSET_LOAD = (joinedload(Beatmapset.owner), selectinload(Beatmapset.beatmaps))
+
+def leaderboard_query(beatmap_id):
+    return db_session.query(Score).options(joinedload(Score.user)) \
+            .join(BeatmapBestScore, BeatmapBestScore.score_id == Score.id) \
+            .filter(BeatmapBestScore.beatmap_id == beatmap_id) \
+            .order_by(BeatmapBestScore.score.desc()).limit(MAX_NUM_SCORES)
+
+def recent_scores_query(user_id):
+    return Score.query.filter(Score.user_id == user_id) \
+            .order_by(Score.id.desc()).limit(MAX_NUM_SCORES)
+
+def players_query(beatmap_ids):
+    # whoever has a best score on any of beatmap_ids, so their profiles can be rebuilt once they're gone
+    return db_session.query(BeatmapBestScore.user_id).filter(BeatmapBestScore.beatmap_id.in_(beatmap_ids)).distinct()
+
+def diffs_query(beatmapset_id):
+    return Beatmap.query.options(*BEATMAP_LOAD).filter(Beatmap.beatmapset_id == beatmapset_id)
+
+def owned_beatmapsets_query(owner_id):
+    return Beatmapset.query.filter(Beatmapset.owner_id == owner_id)
+
+def get_limit(default, maximum):
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
+
+def encode_cursor(key):
+    return urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        key = None
+    if not isinstance(key, (int, str)):
+        abort(400, description = 'Invalid cursor')
+    return key
+
+def page_query(query, column, after, limit):
+    '''
+    the page of query after the row whose column value is after, in column order
+    asks for one extra row so paginate knows whether there's a next page
+    '''
+    if after is not None:
+        query = query.filter(column > after)
+    return query.order_by(column).limit(limit + 1)
+
+def paginate(query, column):
+    '''
+    keyset pagination over a unique indexed column, driven by ?after=<cursor>&limit=
+    returns (rows, cursor for the next page or None)
+    unlike OFFSET, a deep page costs the same as the first one
+    '''
+    cursor = request.args.get('after')
+    after = decode_cursor(cursor) if cursor else None
+    limit = get_limit(DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    rows = page_query(query, column, after, limit).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(getattr(rows[-1], column.key))
+
+def in_order(rows, ids):
+    '''
+    rows fetched with id IN ids, put back in the order of ids (search rank)
+    '''
+    by_id = { row.id: row for row in rows }
+    return [by_id[id] for id in ids if id in by_id]
+
+def record_verification(score_id, verification):
+    try:
+        matches, _ = verification.result()
+    except Exception:
+        matches = False # couldn't be checked, e.g. the pool broke
+    # nothing waits for this, so just queue it
+    submit(lambda: Score.query.filter(Score.id == score_id).update({ 'replay_verified': matches }))
+
+def update_best_score(score):
+    '''
+    point the user's leaderboard entry at score if it beats their old best, and count the play
+    needs score.id, so flush first; caller commits
+    returns the entry and the score it pointed at before, as update_profile takes them
+    '''
+    key = (score.beatmap_id, score.user_id)
+    best = BeatmapBestScore.query.get(key)
+    if best is None:
+        previous_best_id = None
+        best = BeatmapBestScore(beatmap_id=score.beatmap_id, user_id=score.user_id, score_id=score.id,
+                                score=score.score, play_count=1)
+        db_session.add(best)
+    else:
+        previous_best_id = best.score_id
+        best.play_count += 1
+        if score.score <= best.score:
+            return best, score.id
+        best.score_id = score.id
+        best.score = score.score
+    Beatmap.query.filter(Beatmap.id == score.beatmap_id) \
+        .update({ Beatmap.leaderboard_version: Beatmap.leaderboard_version + 1 }, synchronize_session=False)
+    response_cache.invalidate(beatmap_cache_group(score.beatmap_id))
+    return best, previous_best_id
+
+def start_verification(user_id, payload):
+    '''
+    builds the Score for a new_score payload and starts checking its replay, per VERIFICATION_MODE
+    returns (score, verification future or None)
+    '''
+    # tickets queued before scores came with their config have no gameplay_config
+    data = new_score_schema.load({ **payload['score'], 'replay_data': payload['replay_data'],
+                                   'gameplay_config': payload.get('gameplay_config') })
+    replay_data = data.pop('replay_data')
+    config = data.pop('gameplay_config')
+    s = Score(**data, user_id=user_id, time_unix=payload['time_unix'])
+    if replay_data is None or VERIFICATION_MODE == 'off':
+        return s, None
+    beatmap = Beatmap.query.get(s.beatmap_id)
+    if beatmap is None:
+        return s, None
+    try:
+        return s, submit_verification(beatmap, s, replay_data, config)
+    except Exception:
+        # save it unverified rather than lose it
+        s.replay_verified = False
+        return s, None
+
+def finish_verification(s, verification, payload):
+    '''
+    in reject mode, waits for verification and returns an error response if the replay doesn't match
+    returns (verification to record once the score is saved, error response or None)
+    '''
+    if verification is None or VERIFICATION_MODE != 'reject':
+        return verification, None
+    try:
+        matches, recomputed = verification.result(timeout=VERIFICATION_TIMEOUT)
+    except Exception:
+        s.replay_verified = False # save it unverified rather than lose it
+    else:
+        # without the player's config it was simulated with the default one, so a mismatch may just be
+        # their settings and only gets flagged
+        if not matches and payload.get('gameplay_config') is not None:
+            return None, ({ 'message': 'Score does not match replay', 'recomputed': recomputed }, 400)
+        s.replay_verified = matches
+    return None, None
+
+def save_score(user_id, s, replay_data):
+    '''
+    writer unit for new_score: stores s and its replay, updates the user and the leaderboard
+    returns (response, status)
+    '''
+    # one atomic UPDATE, so concurrent scores from the same user can't overwrite each other
+    updated = User.query.filter(User.id == user_id).update({
+        User.key_accuracy_sum: User.key_accuracy_sum + s.key_accuracy,
+        User.kana_accuracy_sum: User.kana_accuracy_sum + s.kana_accuracy,
+        User.play_count: User.play_count + 1,
+        User.total_score: User.total_score + s.score,
+    }, synchronize_session=False)
+    if not updated:
+        return 'Invalid User', 400
+    if replay_data is not None:
+        r = Replay(score=s, data=replay_data)
+        db_session.add(r)
+    db_session.add(s)
+    db_session.flush()
+    best, previous_best_id = update_best_score(s)
+    update_profile(db_session, s, best, previous_best_id)
+    return dump_score(s), 201
+
+def save_queued_scores(entries):
+    '''
+    the ingest consumer's batch: verifies replays in parallel, then saves every score in one writer unit
+    entries are [(ticket id, user id, payload)]; returns {ticket id: (response, status)}
+    '''
+    results = {}
+    pending = []
+    for ticket_id, user_id, payload in entries:
+        # a ticket that can't be started gets its own error, so it can't hold up the rest of the batch
+        try:
+            s, verification = start_verification(user_id, payload)
+        except ValidationError as err:
+            results[ticket_id] = (err.messages, 400)
+            continue
+        except Exception as e:
+            results[ticket_id] = ({ 'message': f'Could not save score: {e}' }, 500)
+            continue
+        s.ticket_id = ticket_id
+        pending.append((ticket_id, user_id, s, payload, verification))
+    db_session.close()
+
+    to_save = []
+    for ticket_id, user_id, s, payload, verification in pending:
+        verification, error = finish_verification(s, verification, payload)
+        if error is not None:
+            results[ticket_id] = error
+        else:
+            to_save.append((ticket_id, user_id, s, payload['replay_data'], verification))
+
+    def write():
+        saved = {}
+        for ticket_id, user_id, s, replay_data, _ in to_save:
+            # saved already, by a worker that died before closing the ticket
+            existing = Score.query.filter(Score.ticket_id == ticket_id).one_or_none()
+            if existing is not None:
+                saved[ticket_id] = (dump_score(existing), 201)
+                continue
+            try:
+                with db_session.begin_nested():
+                    saved[ticket_id] = save_score(user_id, s, replay_data)
+            except Exception as e:
+                saved[ticket_id] = ({ 'message': f'Could not save score: {e}' }, 500)
+        return saved
+    results.update(run_write(write))
+
+    for ticket_id, _, _, _, verification in to_save:
+        result, status = results[ticket_id]
+        if verification is not None and status == 201:
+            verification.add_done_callback(partial(record_verification, result['id']))
+    return results
+
 ################################################################
 ######################### USER METHODS #########################
 ################################################################
@@ -37,73 +368,121 @@ def change_name(user_id):
     json_data = request.get_json()
     if not json_data:
         return 'No input provided', 400
-    user = User.query.get(user_id)
     requested_name = json_data['requested_name']
     if not requested_name or requested_name.endswith(("google", "osu", "github")):
         return 'We do not like your name', 400
 
-    exists_subq = User.query.filter(User.name == requested_name).exists()
-    exists = db_session.query(exists_subq).scalar()
-    if exists:
-        return { 'success': False }, 409
-    user.name = requested_name
-    db_session.commit()
-    return { 'success': True, 'new_name': requested_name }
+    def write():
+        user = User.query.get(user_id)
+        exists_subq = User.query.filter(User.name == requested_name).exists()
+        exists = db_session.query(exists_subq).scalar()
+        if exists:
+            return { 'success': False }, 409
+        user.name = requested_name
+        # names show up in leaderboards and as mapset owners, so those responses change too
+        Beatmapset.query.filter(Beatmapset.owner_id == user_id) \
+            .update({ Beatmapset.version: Beatmapset.version + 1 }, synchronize_session=False)
+        leaderboards = select(BeatmapBestScore.beatmap_id).where(BeatmapBestScore.user_id == user_id)
+        Beatmap.query.filter(Beatmap.id.in_(leaderboards)) \
+            .update({ Beatmap.leaderboard_version: Beatmap.leaderboard_version + 1 }, synchronize_session=False)
+        return { 'success': True, 'new_name': requested_name }
+    return run_write(write)
 
 @api.route('/whoami', methods = ['GET'])
+@read_only
 def whoami():
     user = session.get('user')
     if not user:
         # Not logged in
         return {}
     user = User.query.get(user['id'])
-    res = user_schema.dump(user)
+    res = dump_user(user)
     return res
 
 @api.route('/users/<user_id>', methods=['GET'])
+@read_only
 def get_user(user_id):
-    user = User.query.get(user_id)
+    user = User.query.options(joinedload(User.profile)).get(user_id)
     if user is None:
         abort(404, description = 'User not found')
-    user_result = user_schema.dump(user)
-    user_stats_result = user_stats_schema.dump(user)
-    scores = user.scores.limit(MAX_NUM_SCORES)
-    scores_result = scores_without_user_schema.dump(scores)
-    return {"user": user_result, "scores": scores_result, "stats": user_stats_result}
+    user_result = dump_user(user)
+    user_stats_result = dump_user_stats(user)
+    rankings.refresh(db_session)
+    user_stats_result['rank'] = rankings.rank(user.id)
+    scores = recent_scores_query(user.id)
+    scores_result = dump_scores_without_user(scores)
+    profile_result = user.profile.summary if user.profile is not None else empty_summary()
+    return {"user": user_result, "scores": scores_result, "stats": user_stats_result, "profile": profile_result}
 
 @api.route('/users', methods=['GET'])
+@read_only
 def get_users():
     search_query = request.args.get('search', '')
-    users = User.query.filter(User.name.ilike(f'%{search_query}%')).all()
-    res = users_schema.dump(users)
-    return { 'users': res }
+    # search results come ranked and capped by limit, so they aren't paginated
+    ids = search_users(db_session, search_query, get_limit(DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT))
+    next_cursor = None
+    if ids is None:
+        users, next_cursor = paginate(User.query, User.id)
+    else:
+        users = in_order(User.query.filter(User.id.in_(ids)).all(), ids)
+    res = dump_users(users)
+    return { 'users': res, 'next': next_cursor }
+
+@api.route('/rankings', methods=['GET'])
+@read_only
+def get_rankings():
+    '''
+    users by total score, best first; ties share a rank
+    paginated like the other lists, except the cursor is a position
+    '''
+    cursor = request.args.get('after')
+    start = decode_cursor(cursor) if cursor else 0
+    if not isinstance(start, int) or start < 0:
+        abort(400, description = 'Invalid cursor')
+    limit = get_limit(DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    rankings.refresh(db_session)
+    page = rankings.page(start, limit)
+    users = { user.id: user for user in User.query.filter(User.id.in_([user_id for _, user_id, _ in page])) }
+    res = [{ 'rank': rank, 'total_score': total, 'user': dump_user(users[user_id]) }
+           for rank, user_id, total in page if user_id in users]
+    next_cursor = encode_cursor(start + limit) if start + limit < len(rankings) else None
+    return { 'rankings': res, 'next': next_cursor }
 
 ################################################################
 ######################### BEATMAP METHODS #########################
 ################################################################
 
 @api.route('/beatmaps', methods=['GET'])
+@read_only
 def get_beatmap_list():
     search_query = request.args.get('search', '')
-    owner_result = Beatmap.query.filter(Beatmap.owner_id.ilike('%' + search_query + '%')).all()
-    return { 'beatmaps': list(beatmaps_schema.dump(owner_result)) }
+    # search results come ranked and capped by limit, so they aren't paginated
+    ids = search_beatmaps(db_session, search_query, get_limit(DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT))
+    next_cursor = None
+    if ids is None:
+        beatmaps, next_cursor = paginate(Beatmap.query.options(*BEATMAP_LOAD), Beatmap.id)
+    else:
+        beatmaps = in_order(Beatmap.query.options(*BEATMAP_LOAD).filter(Beatmap.id.in_(ids)).all(), ids)
+    return { 'beatmaps': dump_beatmaps(beatmaps), 'next': next_cursor }
 
 @api.route('/beatmaps/<int:beatmap_id>', methods=['GET'])
+@read_only
+@etagged(beatmap_etag, beatmap_cache_group)
 def get_beatmap_with_set_and_scores(beatmap_id):
-    beatmap = Beatmap.query.get(beatmap_id)
+    beatmap = Beatmap.query.options(*BEATMAP_LOAD,
+                                    joinedload(Beatmap.beatmapset).options(*BEATMAPSET_LOAD)).get(beatmap_id)
     if beatmap is None:
         abort(404, description = 'Beatmap not found')
-    beatmap_result = beatmap_schema.dump(beatmap)
-    best_scores_subquery = db_session.query(Score.user_id, func.max(Score.score).label('maxscore')) \
-                            .filter(Score.beatmap_id == beatmap_id) \
-                            .group_by(Score.user_id) \
-                            .subquery()
-    scores = db_session.query(Score).join(best_scores_subquery, and_( \
-            best_scores_subquery.c.user_id == Score.user_id, \
-            best_scores_subquery.c.maxscore == Score.score)) \
-            .order_by(Score.score.desc()).limit(MAX_NUM_SCORES).all()
-    scores_result = scores_schema.dump(scores)
-    beatmapset_result = beatmapset_schema.dump(beatmap.beatmapset)
+    if request.args.get('format') == 'parsed':
+        # timing points and lines already split out, instead of the raw file
+        beatmap_result = dump_beatmap(beatmap)
+        del beatmap_result['content']
+        beatmap_result['parsed'] = get_parsed_beatmap(beatmap)
+    else:
+        beatmap_result = dump_beatmap(beatmap)
+    scores = leaderboard_query(beatmap_id).all()
+    scores_result = dump_scores(scores)
+    beatmapset_result = dump_beatmapset(beatmap.beatmapset)
     return { **process_beatmap(beatmap_result), 'scores' : scores_result, 'beatmapset' : beatmapset_result }
 
 @api.route('/beatmaps', methods=['POST'])
@@ -137,19 +516,24 @@ def add_beatmap(user_id):
     # artist, title, artist_original, title_original, yt_id, preview_point, duration = \
     #     itemgetter('artist', 'title', 'artist_original', 'title_original', 'yt_id', 'preview_point', 'duration')(data)
 
-    exists_subq = Beatmapset.query.filter(
-            Beatmapset.owner_id == user_id,
-            Beatmapset.id == bms_id).exists()
-    exists = db_session.query(exists_subq).scalar()
-    if not exists:
-        return 'Beatmapset does not exist or you do not own it!', 400
-
-    beatmap = Beatmap(**data)
-    db_session.add(beatmap)
-    db_session.commit()
-
-    res = beatmap_schema.dump(beatmap)
-    return res, 201
+    def write():
+        exists_subq = Beatmapset.query.filter(
+                Beatmapset.owner_id == user_id,
+                Beatmapset.id == bms_id).exists()
+        exists = db_session.query(exists_subq).scalar()
+        if not exists:
+            return 'Beatmapset does not exist or you do not own it!', 400
+
+        beatmap = Beatmap(**data)
+        db_session.add(beatmap)
+        beatmapset = Beatmapset.query.get(bms_id)
+        bump_version(beatmapset)
+        invalidate_cached_beatmapset(beatmapset)
+        db_session.flush()
+
+        res = dump_beatmap(beatmap)
+        return res, 201
+    return run_write(write)
 
 @api.route('/beatmaps/<int:beatmap_id>', methods=['PUT'])
 @login_required
@@ -166,63 +550,86 @@ def update_beatmap(user_id, beatmap_id):
     except ValidationError as err:
         return err.messages, 400
 
-    beatmap = Beatmap.query.get(beatmap_id)
-    if not beatmap:
-        return 'Beatmap does not exist!', 400
-    bms_id = beatmap.beatmapset_id
-
-    exists_subq = Beatmapset.query.filter(
-            Beatmapset.owner_id == user_id,
-            Beatmapset.id == bms_id).exists()
-    exists = db_session.query(exists_subq).scalar()
-    if not exists:
-        return 'Beatmapset does not exist or you do not own it!', 400
-
-    for k, v in data.items():
-        setattr(beatmap, k, v)
-    db_session.commit()
-    res = beatmap_schema.dump(beatmap)
-    return res
+    def write():
+        beatmap = Beatmap.query.get(beatmap_id)
+        if not beatmap:
+            return 'Beatmap does not exist!', 400
+        bms_id = beatmap.beatmapset_id
+
+        exists_subq = Beatmapset.query.filter(
+                Beatmapset.owner_id == user_id,
+                Beatmapset.id == bms_id).exists()
+        exists = db_session.query(exists_subq).scalar()
+        if not exists:
+            return 'Beatmapset does not exist or you do not own it!', 400
+
+        for k, v in data.items():
+            setattr(beatmap, k, v)
+        bump_version(beatmap, beatmap.beatmapset)
+        invalidate_cached_beatmapset(beatmap.beatmapset)
+        db_session.flush()
+        res = dump_beatmap(beatmap)
+        return res
+    return run_write(write)
 
 @api.route('/beatmaps/<int:beatmap_id>', methods=['DELETE'])
 @login_required
 def delete_beatmap(user_id, beatmap_id):
-    beatmap = Beatmap.query.get(beatmap_id)
-    if not beatmap:
-        return 'Beatmap does not exist!', 400
-    bms_id = beatmap.beatmapset_id
-
-    exists_subq = Beatmapset.query.filter(
-            Beatmapset.owner_id == user_id,
-            Beatmapset.id == bms_id).exists()
-    exists = db_session.query(exists_subq).scalar()
-    if not exists:
-        return 'Beatmapset does not exist or you do not own it!', 400
-    db_session.delete(beatmap)
-    db_session.commit()
-    return { 'success': True, 'beatmapset_id': bms_id }
+    def write():
+        beatmap = Beatmap.query.get(beatmap_id)
+        if not beatmap:
+            return 'Beatmap does not exist!', 400
+        bms_id = beatmap.beatmapset_id
+
+        exists_subq = Beatmapset.query.filter(
+                Beatmapset.owner_id == user_id,
+                Beatmapset.id == bms_id).exists()
+        exists = db_session.query(exists_subq).scalar()
+        if not exists:
+            return 'Beatmapset does not exist or you do not own it!', 400
+        bump_version(beatmap.beatmapset)
+        players = players_query([beatmap_id]).all()
+        db_session.delete(beatmap)
+        invalidate_cached_beatmapset(beatmap.beatmapset)
+        db_session.flush()
+        rebuild_profiles(db_session, [user_id for user_id, in players])
+        return { 'success': True, 'beatmapset_id': bms_id }
+    return run_write(write)
 
 ################################################################
 ######################### MAPSET METHODS #########################
 ################################################################
 
 @api.route('/beatmapsets/<int:beatmapset_id>', methods=['GET'])
+@read_only
+@etagged(beatmapset_etag, beatmapset_cache_group)
 def get_beatmapset_with_diffs_and_scores(beatmapset_id):
     # TODO: do we need to run process_beatmap on result
-    beatmapset = Beatmapset.query.get(beatmapset_id)
+    # beatmaps gets replaced by the full diffs below
+    beatmapset = Beatmapset.query.options(joinedload(Beatmapset.owner), noload(Beatmapset.beatmaps)).get(beatmapset_id)
     if beatmapset is None:
         abort(404, description = 'Beatmapset not found')
-    beatmapset_result = beatmapset_schema.dump(beatmapset)
-    beatmaps_result = beatmaps_schema.dump(beatmapset.beatmaps)
+    beatmapset_result = dump_beatmapset(beatmapset)
+    beatmaps_result = dump_beatmaps(diffs_query(beatmapset_id))
     # list(map(process_beatmap, beatmaps_result))
     return { **beatmapset_result, 'beatmaps': beatmaps_result }
 
 @api.route('/beatmapsets', methods=['GET'])
+@read_only
 def get_beatmapset_list():
+    owner_id = request.args.get('owner')
+    if owner_id is not None:
+        owner_result, next_cursor = paginate(owned_beatmapsets_query(owner_id).options(*BEATMAPSET_LOAD), Beatmapset.id)
+        return { 'beatmapsets': dump_beatmapsets(owner_result), 'next': next_cursor }
     search_query = request.args.get('search', '')
-    owner_result = Beatmapset.query.filter(Beatmapset.owner_id.ilike('%' + search_query + '%')).all()
+    ids = search_beatmapsets(db_session, search_query, get_limit(DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT))
+    next_cursor = None
+    if ids is None:
+        owner_result, next_cursor = paginate(Beatmapset.query.options(*BEATMAPSET_LOAD), Beatmapset.id)
+    else:
+        owner_result = in_order(Beatmapset.query.options(*BEATMAPSET_LOAD).filter(Beatmapset.id.in_(ids)).all(), ids)
     # https://softwareengineering.stackexchange.com/questions/286293/whats-the-best-way-to-return-an-array-as-a-response-in-a-restful-api
-    return { 'beatmapsets': list(beatmapsets_schema.dump(owner_result)) }
+    return { 'beatmapsets': dump_beatmapsets(owner_result), 'next': next_cursor }
 
 @api.route('/beatmapsets', methods=['POST'])
 @login_required
@@ -243,16 +650,15 @@ def add_beatmapset(user_id):
     except ValidationError as err:
         return err.messages, 400
 
-    owner = User.query.get(user_id)
-    assert owner is not None
+    def write():
+        owner = User.query.get(user_id)
+        assert owner is not None
 
-    new_bmset = Beatmapset(**data, owner_id=user_id)
-    db_session.add(new_bmset)
-    db_session.commit()
-# Beatmapset.query.get(new_bmset.id)
-    res = beatmapset_schema.dump(new_bmset)
-    print(res)
-    return res, 201
+        new_bmset = Beatmapset(**data, owner_id=user_id)
+        db_session.add(new_bmset)
+        db_session.flush()
+        return dump_beatmapset(new_bmset), 201
+    return run_write(write)
 
 @api.route('/beatmapsets/<int:beatmapset_id>', methods=['PUT'])
 @login_required
@@ -268,27 +674,36 @@ def update_beatmapset(user_id, beatmapset_id):
     except ValidationError as err:
         return err.messages, 400
 
-    bmset = Beatmapset.query.get(beatmapset_id)
-    if not bmset or bmset.owner_id != user_id:
-        return 'Beatmapset does not exist or you do not own it!', 400
+    def write():
+        bmset = Beatmapset.query.get(beatmapset_id)
+        if not bmset or bmset.owner_id != user_id:
+            return 'Beatmapset does not exist or you do not own it!', 400
 
-    for k, v in data.items():
-        setattr(bmset, k, v)
-    db_session.commit()
-    res = beatmapset_schema.dump(bmset)
-    return res
+        for k, v in data.items():
+            setattr(bmset, k, v)
+        bump_version(bmset)
+        invalidate_cached_beatmapset(bmset)
+        db_session.flush()
+        res = dump_beatmapset(bmset)
+        return res
+    return run_write(write)
 
 @api.route('/beatmapsets/<int:beatmapset_id>', methods=['DELETE'])
 @login_required
 def delete_beatmapset(user_id, beatmapset_id):
-    beatmap_set = Beatmapset.query.filter(
-            Beatmapset.owner_id == user_id,
-            Beatmapset.id == beatmapset_id).one_or_none()
-    if not beatmap_set:
-        return 'Beatmapset does not exist or you do not own it!', 400
-    db_session.delete(beatmap_set)
-    db_session.commit()
-    return { 'success': True }
+    def write():
+        beatmap_set = Beatmapset.query.filter(
+                Beatmapset.owner_id == user_id,
+                Beatmapset.id == beatmapset_id).one_or_none()
+        if not beatmap_set:
+            return 'Beatmapset does not exist or you do not own it!', 400
+        invalidate_cached_beatmapset(beatmap_set)
+        players = players_query([beatmap.id for beatmap in beatmap_set.beatmaps]).all()
+        db_session.delete(beatmap_set)
+        db_session.flush()
+        rebuild_profiles(db_session, [user_id for user_id, in players])
+        return { 'success': True }
+    return run_write(write)
 
 ################################################################
 ######################### OTHER METHODS #########################
@@ -298,7 +713,7 @@ def delete_beatmapset(user_id, beatmapset_id):
 @login_required
 def new_score(user_id):
     # XXX: UID probably is in session or something, so we can't fake for someone else
-    # TODO: Probably need protection lol fake scores
+    # scores with a replay get recomputed by verification.py, see REPLAY_VERIFICATION
     '''
     Data
     ----
@@ -312,35 +727,58 @@ def new_score(user_id):
 
     optionally:
     replay_data
+    gameplay_config: type_polygraphs and kana_spellings the replay was played with
     '''
     json_data = request.get_json()
-    
-    replay_data = None
-    if "replay_data" in json_data:
-        replay_data = json_data["replay_data"]
-        del json_data["replay_data"]
-
     if not json_data:
         return 'No input provided', 400
     try:
-        data = score_schema.load(json_data)
+        new_score_schema.load(json_data)
     except ValidationError as err:
         return err.messages, 400
-    s = Score(**data, user_id=user_id, time_unix=int(time()))
-    user = User.query.filter_by(id=user_id).first()
-    if not user:
-       return 'Invalid User', 400
-
-    if replay_data is not None:
-        r = Replay(score_id=s.id, data=replay_data)
-        db_session.add(r)
+    replay_data = json_data.pop("replay_data", None)
+    gameplay_config = json_data.pop("gameplay_config", None)
+    payload = { 'score': json_data, 'replay_data': replay_data, 'gameplay_config': gameplay_config, 'time_unix': int(time()) }
+
+    if SCORE_INGESTION == 'queued':
+        start_consumer(save_queued_scores)
+        ticket_id = enqueue(user_id, payload)
+        return { 'ticket': ticket_id, 'status': 'queued' }, 202
+
+    s, verification = start_verification(user_id, payload)
+    verification, error = finish_verification(s, verification, payload)
+    if error is not None:
+        return error
+    score_result, status = run_write(partial(save_score, user_id, s, replay_data))
+    if verification is not None and status == 201:
+        verification.add_done_callback(partial(record_verification, score_result['id']))
+    return score_result, status
+
+@api.route('/cache', methods=['GET'])
+def get_cache_stats():
+    if not STATS_ENDPOINTS:
+        abort(404)
+    # hit and miss counts are this worker's
+    return response_cache.stats()
+
+@api.route('/scores/tickets/<ticket_id>', methods=['GET'])
+@login_required
+def get_score_ticket(user_id, ticket_id):
+    ticket = get_ticket(ticket_id) if SCORE_INGESTION == 'queued' else None
+    if ticket is None or ticket.user_id != user_id:
+        abort(404, description = 'Ticket not found')
+    res = { 'ticket': ticket.id, 'status': ticket.status }
+    if ticket.status == 'done':
+        res['status_code'] = ticket.status_code
+        res['result'] = json.loads(ticket.result)
+    return res
 
-    user.key_accuracy = (user.key_accuracy * user.play_count + s.key_accuracy) / (user.play_count + 1)
-    user.kana_accuracy = (user.kana_accuracy * user.play_count + s.kana_accuracy) / (user.play_count + 1)
-    user.play_count += 1
-    user.total_score += s.score
-    db_session.add(s)
-    db_session.commit()
+@api.after_request
+def compress_api_response(response):
+    return compress_response(response)
 
-    score_result = score_schema.dump(s)
-    return score_result, 201
+@api.before_app_first_request
+def start_score_ingestion():
+    # picks up whatever was still queued when the last process stopped
+    if SCORE_INGESTION == 'queued':
+        start_consumer(save_queued_scores)
@@ -2,12 +2,14 @@ import os
 from flask import Flask, redirect, session
 
 from database import db_session
+from static_files import send_build_file
 
 # Blueprints
 from api import api
 from oauth import github_blueprint, osu_blueprint, google_blueprint
 
-app = Flask(__name__, static_folder="../frontend/build", static_url_path='/static/')
+# the built frontend is served by static_files.py instead of flask's static route
+app = Flask(__name__, static_folder=None)
 
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "supersekritsfasdfsaflksjfajlksjfsk")
 app.register_blueprint(api, url_prefix='/api')
@@ -15,14 +17,75 @@ app.register_blueprint(github_blueprint, url_prefix='/api/login/github')
 app.register_blueprint(osu_blueprint, url_prefix='/api/login/osu')
 app.register_blueprint(google_blueprint, url_prefix='/api/login/google')
 
+@app.cli.command('rebuild-best-scores')
+def rebuild_best_scores_command():
+    from models import rebuild_best_scores
+    rebuild_best_scores()
+
+@app.cli.command('rebuild-user-stats')
+def rebuild_user_stats_command():
+    from models import rebuild_user_stats
+    rebuild_user_stats()
+
+@app.cli.command('rebuild-profiles')
+def rebuild_profiles_command():
+    from database import db_session
+    from profiles import rebuild_profiles
+    rebuild_profiles(db_session)
+    db_session.commit()
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    from database import engine
+    from search import rebuild_search_index
+    from user_search import rebuild_user_search_index
+    with engine.begin() as connection:
+        rebuild_search_index(connection)
+        rebuild_user_search_index(connection)
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    from query_plans import find_scans
+    bad = find_scans()
+    for name, plan in bad.items():
+        print(f'{name} scans a table:')
+        for line in plan:
+            print(f'  {line}')
+    if bad:
+        raise SystemExit(1)
+    print('All hot queries use indexes')
+
+@app.cli.command('check-query-counts')
+def check_query_counts_command():
+    from query_counts import QUERY_BUDGETS, find_over_budget
+    bad = find_over_budget(app.test_client())
+    for url, statements in bad.items():
+        print(f'{url} ran {len(statements)} queries:')
+        for statement in statements:
+            print(f'  {statement}')
+    if bad:
+        raise SystemExit(1)
+    print(f'All {len(QUERY_BUDGETS)} endpoints are within their query budgets')
+
+@app.cli.command('gc-blobs')
+def gc_blobs_command():
+    from blobstore import delete_blobs
+    from models import referenced_blob_hashes
+    removed = delete_blobs(referenced_blob_hashes())
+    print(f'Removed {removed} unreferenced blobs')
+
 @app.teardown_appcontext
 def shutdown_session(exception=None):
     db_session.remove()
 
+@app.route('/static/<path:filename>')
+def static_file(filename):
+    return send_build_file(filename)
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def index(path):
-    return app.send_static_file('index.html')
+    return send_build_file('index.html')
 
 @app.route('/api/logout', methods = ['POST'])
 def logout():
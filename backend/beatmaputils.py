@@ -0,0 +1,82 @@
+'''
+server side reader for "ishpytoing file format v1" (Beatmap.content)
+mirrors processBeatmap in frontend/src/utils/beatmaputils.ts, minus kana
+(kana depend on the player's config, so clients still compute those)
+'''
+from collections import OrderedDict
+import re
+from threading import Lock
+
+HEADER = 'ishpytoing file format v1\n\n[TimingPoints]\n'
+LINES_HEADER = '\n\n[Lines]\n'
+NEWLINE = re.compile(r'\r?\n')
+LEADING_INT = re.compile(r'\s*[-+]?\d+')
+
+MAX_CACHED_BEATMAPS = 256
+
+def parse_int(s):
+    '''
+    like js parseInt: reads the leading integer, None if there isn't one
+    '''
+    match = LEADING_INT.match(s)
+    return int(match.group()) if match else None
+
+def parse_beatmap(content, duration=None):
+    '''
+    returns {
+        'timing_points': [[time, bpm], ...],
+        'lines': [[start_time, end_time, lyric, [[time, text], ...]], ...],
+        'end_time': time of the E object, or None,
+    }
+    a line with no E after it ends at duration, like the frontend
+    '''
+    parsed = { 'timing_points': [], 'lines': [], 'end_time': None }
+    if not content:
+        return parsed
+    timing, _, objects = content[len(HEADER):].partition(LINES_HEADER)
+    if timing:
+        for point in NEWLINE.split(timing):
+            time, bpm = (point.split(',') + [''])[:2]
+            parsed['timing_points'].append([parse_int(time), parse_int(bpm)])
+
+    lines = parsed['lines']
+    line = None
+    for obj_str in NEWLINE.split(objects):
+        obj_type, _, rest = obj_str.partition(',')
+        time_str, _, text = rest.partition(',')
+        time = parse_int(time_str)
+
+        if obj_type == 'E':
+            parsed['end_time'] = time
+        if line is not None and obj_type in ('L', 'E'):
+            line[1] = time
+            lines.append(line)
+            line = None
+        if obj_type == 'L':
+            line = [time, 0, text, []]
+        elif obj_type == 'S' and line is not None:
+            line[3].append([time, text])
+    if parsed['end_time'] is None and line is not None:
+        line[1] = duration
+        lines.append(line)
+    return parsed
+
+_cache = OrderedDict() # (beatmap_id, content_hash, duration) -> parsed
+_cache_lock = Lock()
+
+def get_parsed_beatmap(beatmap):
+    '''
+    parse_beatmap for a Beatmap row, reusing the last parse while content is unchanged
+    only reads content from the blob store on a miss
+    '''
+    key = (beatmap.id, beatmap.content_hash, beatmap.duration)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    parsed = parse_beatmap(beatmap.content, beatmap.duration)
+    with _cache_lock:
+        _cache[key] = parsed
+        while len(_cache) > MAX_CACHED_BEATMAPS:
+            _cache.popitem(last=False)
+    return parsed
@@ -0,0 +1,81 @@
+'''
+score submission throughput from many request threads: each committing for itself vs going through writer.py
+every submission inserts a score and bumps the user's aggregates, like new_score
+
+run from backend/: python benchmarks/group_commit.py [threads] [submissions per thread]
+set SQLITE_SYNCHRONOUS=FULL to see it with an fsync per commit
+'''
+import os
+import sys
+import tempfile
+from threading import Thread
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{directory}/data.db'
+
+from sqlalchemy.exc import OperationalError
+
+from database import Base, db_session, engine
+from models import Score, User
+from writer import run_write
+
+NUM_USERS = 100
+
+def setup():
+    Base.metadata.create_all(engine)
+    db_session.add_all([User(id=str(i), name=str(i), avatar_url='') for i in range(NUM_USERS)])
+    db_session.commit()
+    db_session.remove()
+
+def add_score(i):
+    user = User.query.get(str(i % NUM_USERS))
+    user.play_count += 1
+    user.total_score += i
+    db_session.add(Score(beatmap_id=1, user_id=user.id, score=i, key_accuracy=1, kana_accuracy=1, time_unix=0))
+
+def direct(i):
+    add_score(i)
+    db_session.commit()
+
+def queued(i):
+    run_write(lambda: add_score(i))
+
+def run(submit, threads, n):
+    latencies = []
+    errors = []
+    def worker(t):
+        for j in range(n):
+            start = perf_counter()
+            try:
+                submit(t * n + j)
+            except OperationalError:
+                db_session.rollback()
+                errors.append(1)
+            latencies.append(perf_counter() - start)
+        db_session.remove()
+    start = perf_counter()
+    workers = [Thread(target=worker, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = perf_counter() - start
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return (len(latencies) - len(errors)) / elapsed, latencies[len(latencies) // 2] * 1000, p99, len(errors)
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    setup()
+    print(f'{threads} threads x {n} submissions, synchronous={os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")}')
+    print(f'{"mode":<8}{"saved/s":>9}{"p50 ms":>9}{"p99 ms":>9}{"errors":>8}')
+    for name, submit in [('direct', direct), ('queued', queued)]:
+        rate, p50, p99, errors = run(submit, threads, n)
+        print(f'{name:<8}{rate:>9.0f}{p50:>9.2f}{p99:>9.2f}{errors:>8}')
+
+if __name__ == '__main__':
+    main()
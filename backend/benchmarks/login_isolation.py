@@ -0,0 +1,118 @@
+'''
+gameplay latency while a slow login provider gets a burst of logins
+the app runs in a server with a fixed pool of request threads, like gunicorn's gthread worker (gunicorn.conf.py);
+the stub provider takes [latency] seconds per token exchange
+without a cap the burst takes every thread and GET /api/users waits behind it; with LOGIN_CONCURRENCY it doesn't
+
+run from backend/: python benchmarks/login_isolation.py [logins] [latency]
+'''
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import sys
+import tempfile
+from threading import BoundedSemaphore, Event, Thread
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{directory}/data.db'
+
+import requests
+from werkzeug.serving import BaseWSGIServer
+
+from app import app
+from database import Base, engine
+from oauth import LOGIN_CONCURRENCY, OAuth, construct_oauth_blueprint, github_user_func
+
+THREADS = 8
+LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 2
+
+class StubProvider(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        sleep(LATENCY)
+        self.send_json({ 'access_token': 'stub-token' })
+
+    def do_GET(self):
+        self.send_json({ 'login': 'stubuser', 'id': 1, 'avatar_url': 'https://example.com/a.png' })
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class PooledServer(BaseWSGIServer):
+    '''
+    werkzeug's server, but with THREADS request threads and a queue in front, like gthread
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(THREADS)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.handle_in_pool, request, client_address)
+
+    def handle_in_pool(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+def start(server):
+    Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+def burst(base, provider, logins):
+    '''
+    fires the logins all at once while one client keeps requesting GET /api/users
+    '''
+    done = Event()
+    latencies = []
+    def gameplay():
+        while not done.is_set():
+            start = perf_counter()
+            requests.get(f'{base}/api/users')
+            latencies.append(perf_counter() - start)
+    player = Thread(target=gameplay)
+    player.start()
+    sleep(0.2)
+    with ThreadPoolExecutor(logins) as pool:
+        login = lambda _: requests.post(f'{base}/stub/{provider}/authorize', json={ 'state': 'state', 'code': 'x' }).status_code
+        statuses = list(pool.map(login, range(logins)))
+    done.set()
+    player.join()
+    latencies.sort()
+    return statuses, latencies
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    Base.metadata.create_all(engine)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    stub = start(ThreadingHTTPServer(('127.0.0.1', 0), StubProvider))
+    for name in ('uncapped', 'capped'):
+        provider = OAuth('id', 'secret', 'state', f'{stub}/authorize', f'{stub}/token', None, f'{stub}/user', None)
+        if name == 'uncapped':
+            provider.login_slots = BoundedSemaphore(logins)
+        app.register_blueprint(construct_oauth_blueprint(name, provider, github_user_func), url_prefix=f'/stub/{name}')
+    base = start(PooledServer('127.0.0.1', 0, app))
+    print(f'{THREADS} request threads, {logins} logins, provider latency {LATENCY}s, LOGIN_CONCURRENCY={LOGIN_CONCURRENCY}')
+    print(f'{"logins":<10}{"200":>6}{"503":>6}{"gameplay reqs":>15}{"p50 ms":>9}{"max ms":>9}')
+    for name in ('uncapped', 'capped'):
+        statuses, latencies = burst(base, name, logins)
+        p50, slowest = latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000
+        print(f'{name:<10}{statuses.count(200):>6}{statuses.count(503):>6}{len(latencies):>15}{p50:>9.1f}{slowest:>9.0f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+'''
+logins against a local stub OAuth provider: the old one-off requests.post/get calls vs OAuth.call's pooled session
+then how POST /api/login/<provider>/authorize copes with a slow, flaky or unreachable provider
+the stub is plain http, so the saved handshakes are only TCP ones; against real providers TLS makes the gap bigger
+
+run from backend/: python benchmarks/oauth_client.py [logins]
+'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import sys
+import tempfile
+from threading import Thread
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{directory}/data.db'
+os.environ.setdefault('OAUTH_READ_TIMEOUT', '1')
+
+import requests
+
+from app import app
+from database import Base, engine
+from oauth import OAuth, construct_oauth_blueprint, github_user_func
+
+class StubProvider(BaseHTTPRequestHandler):
+    '''
+    /token and /user like github's; a /slow/ prefix answers after 30s, /flaky/ fails every other /user with a 503
+    '''
+    protocol_version = 'HTTP/1.1' # keep-alive
+    wbufsize = -1 # one write per response, or delayed ACKs stall every kept alive request
+    disable_nagle_algorithm = True
+    connections = 0
+    flaky_calls = 0
+
+    def setup(self):
+        StubProvider.connections += 1
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self):
+        if self.path.startswith('/slow/'):
+            sleep(30)
+        if self.path == '/flaky/user':
+            StubProvider.flaky_calls += 1
+            if StubProvider.flaky_calls % 2:
+                return self.send_json({ 'message': 'try again' }, 503)
+        if self.path.endswith('/token'):
+            return self.send_json({ 'access_token': 'stub-token' })
+        return self.send_json({ 'login': 'stubuser', 'id': 1, 'avatar_url': 'https://example.com/a.png' })
+
+    do_GET = do_POST = answer
+
+    def send_json(self, data, status=200):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubProvider)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+def make_oauth(base, prefix=''):
+    return OAuth('id', 'secret', 'state', f'{base}{prefix}/authorize', f'{base}{prefix}/token', None, f'{base}{prefix}/user', None)
+
+def old_login(oauth):
+    # what authorize and github_user_func did before: no session, no timeout
+    token = requests.post(oauth.token_url, headers={ 'Accept': 'application/json' }, data={ 'code': 'x' }).json()
+    return requests.get(oauth.api_url, headers={ 'Authorization': f'token {token["access_token"]}' }).json()
+
+def new_login(oauth):
+    token = oauth.authorize('x')
+    return github_user_func(oauth, token['access_token'])
+
+def throughput(login, oauth, n):
+    before = StubProvider.connections
+    start = perf_counter()
+    for _ in range(n):
+        login(oauth)
+    return n / (perf_counter() - start), StubProvider.connections - before
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    Base.metadata.create_all(engine)
+    base = start_stub()
+    oauth = make_oauth(base)
+    new_login(oauth) # warm up
+    print(f'{"client":<10}{"logins/s":>10}{"connections":>13}')
+    for name, login in [('one-off', old_login), ('pooled', new_login)]:
+        rate, connections = throughput(login, oauth, n)
+        print(f'{name:<10}{rate:>10,.0f}{connections:>13}')
+    print(f'pooled metrics: {oauth.metrics.stats()}')
+
+    # a closed port stands in for a provider that's down
+    down = make_oauth('http://127.0.0.1:9')
+    print(f'\nPOST /authorize, read timeout {os.environ["OAUTH_READ_TIMEOUT"]}s')
+    for name, provider in [('healthy', oauth), ('slow', make_oauth(base, '/slow')), ('flaky', make_oauth(base, '/flaky')),
+                           ('down', down)]:
+        app.register_blueprint(construct_oauth_blueprint(name, provider, github_user_func), url_prefix=f'/stub/{name}')
+        client = app.test_client()
+        start = perf_counter()
+        res = client.post(f'/stub/{name}/authorize', json={ 'state': 'state', 'code': 'x' })
+        print(f'{name:<10}{res.status_code:>5}{(perf_counter() - start) * 1000:>9.0f} ms  {provider.metrics.stats()}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+'''
+a heavy player's profile summary: worked out from their whole score history per request vs read from user_profiles
+and what keeping it up to date adds to saving a score (update_profile)
+
+run from backend/: python benchmarks/profiles.py [scores] [maps]
+'''
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{directory}/data.db'
+
+from sqlalchemy import func, insert
+
+from database import Base, db_session, engine
+from models import Beatmap, Score, User, UserProfile, rebuild_best_scores
+from profiles import build_summary, rebuild_profiles, update_profile
+
+USER_ID = '1github'
+
+def make_data(num_scores, num_maps):
+    rng = random.Random(0)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{ 'id': USER_ID, 'name': 'grinder', 'join_time': 0 }])
+        connection.execute(insert(Beatmap), [{ 'id': i } for i in range(num_maps)])
+        connection.execute(insert(Score), [{
+            'id': i + 1, 'user_id': USER_ID, 'beatmap_id': int(rng.paretovariate(1)) % num_maps,
+            'score': rng.randrange(1000000), 'key_accuracy': 0.95, 'kana_accuracy': 0.95, 'time_unix': i,
+            'speed_modification': rng.choice([1.0, 1.5]), 'mod_flag': rng.choice([0, 1]),
+        } for i in range(num_scores)])
+    rebuild_best_scores()
+    rebuild_profiles(db_session)
+    db_session.commit()
+
+def from_history():
+    '''
+    the summary without user_profiles or beatmap_best_scores: every score of the user, best per map in python
+    '''
+    plays = { beatmap_id: count for beatmap_id, count in db_session.query(Score.beatmap_id, func.count())
+              .filter(Score.user_id == USER_ID).group_by(Score.beatmap_id) }
+    bests = {}
+    for score in Score.query.filter(Score.user_id == USER_ID):
+        best = bests.get(score.beatmap_id)
+        if best is None or (score.score, -score.id) > (best.score, -best.id):
+            bests[score.beatmap_id] = score
+    summary = build_summary([(score, plays[beatmap_id]) for beatmap_id, score in bests.items()])
+    db_session.remove()
+    return summary
+
+def from_profile():
+    summary = db_session.query(UserProfile).get(USER_ID).summary
+    db_session.remove()
+    return summary
+
+def time_per_call(f, seconds=1):
+    n = 0
+    start = perf_counter()
+    while perf_counter() - start < seconds:
+        f()
+        n += 1
+    return (perf_counter() - start) / n
+
+def save_scores(n, with_profile):
+    '''
+    the best score and profile part of api.save_score for n new scores; returns seconds per score
+    '''
+    from api import update_best_score
+    rng = random.Random(1)
+    num_maps = db_session.query(func.count(Beatmap.id)).scalar()
+    next_id = db_session.query(func.max(Score.id)).scalar() + 1
+    start = perf_counter()
+    for i in range(n):
+        s = Score(id=next_id + i, user_id=USER_ID, beatmap_id=rng.randrange(num_maps), score=rng.randrange(1000000),
+                  key_accuracy=0.95, kana_accuracy=0.95, time_unix=0, speed_modification=1.0, mod_flag=0)
+        db_session.add(s)
+        db_session.flush()
+        best, previous_best_id = update_best_score(s)
+        if with_profile:
+            update_profile(db_session, s, best, previous_best_id)
+        db_session.commit()
+    return (perf_counter() - start) / n
+
+def main():
+    num_scores = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    num_maps = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    Base.metadata.create_all(engine)
+    make_data(num_scores, num_maps)
+    assert from_history() == from_profile()
+    print(f'{num_scores:,} scores on {num_maps:,} maps')
+    print(f'summary from score history  {time_per_call(from_history) * 1000:>8.2f} ms')
+    print(f'summary from user_profiles  {time_per_call(from_profile) * 1000:>8.2f} ms')
+    print(f'saving a score, without profile  {save_scores(500, False) * 1000:>6.2f} ms')
+    rebuild_profiles(db_session)
+    db_session.commit()
+    print(f'saving a score, with profile     {save_scores(500, True) * 1000:>6.2f} ms')
+    db_session.remove()
+    assert from_history() == from_profile()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+'''
+replay storage: bytes per keystroke and encode/decode speed, v1 text vs v2 (with and without zlib)
+uses the same sloppy 'flos' replay as replay_verification.py
+
+run from backend/: python benchmarks/replay_codec.py [iterations]
+'''
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gameplayutils import deserialize_replay, serialize_replay
+from replayutils import encode_key_log, decode_key_log
+from replay_verification import make_replay
+
+def rate(f, n):
+    start = perf_counter()
+    for _ in range(n):
+        f()
+    return n / (perf_counter() - start)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    replay, keystrokes = make_replay()
+    key_log = deserialize_replay(replay)
+    v1 = replay.encode()
+    v2 = encode_key_log(key_log, compress=False)
+    v2_zlib = encode_key_log(key_log)
+    assert decode_key_log(v2) == decode_key_log(v2_zlib) == key_log
+
+    print(f'{keystrokes} keystrokes')
+    print(f'{"format":<10}{"bytes":>8}{"B/key":>8}{"encode/s":>12}{"decode/s":>12}')
+    for name, size, encode, decode in [
+        ('v1', len(v1), lambda: serialize_replay(key_log).encode(), lambda: deserialize_replay(v1.decode())),
+        ('v2', len(v2), lambda: encode_key_log(key_log, compress=False), lambda: decode_key_log(v2)),
+        ('v2+zlib', len(v2_zlib), lambda: encode_key_log(key_log), lambda: decode_key_log(v2_zlib)),
+    ]:
+        print(f'{name:<10}{size:>8}{size / keystrokes:>8.2f}{rate(encode, n):>12.0f}{rate(decode, n):>12.0f}')
+
+if __name__ == '__main__':
+    main()
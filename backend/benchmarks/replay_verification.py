@@ -0,0 +1,64 @@
+'''
+replays verified per second, single core and through the verification pool
+uses the seeded 'flos' map (~4:40, 1211 keystrokes perfect) with a sloppy replay:
+timing jitter plus some wrong keys, so the skip/miss paths get exercised too
+
+run from backend/: python benchmarks/replay_verification.py [replays] [workers]
+'''
+import os
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from beatmaputils import parse_beatmap
+from gameplayutils import REPLAY_HEADER, simulate_perfect_replay
+from kana import DEFAULT_CONFIG
+from models import flos_content
+from verification import recompute_stats, verify_score
+from concurrent.futures import ProcessPoolExecutor
+
+DURATION = 280000
+BASE_KEY_SCORE = 825.7638315441784
+
+def make_replay(seed=0):
+    rng = random.Random(seed)
+    key_log = []
+    last_time = offset = 0
+    for key, timestamp in simulate_perfect_replay(parse_beatmap(flos_content, DURATION)['lines']):
+        if timestamp != last_time:
+            # new syllable: drift somewhere around it, then type through in order
+            last_time, offset = timestamp, rng.randint(-60, 150)
+        offset += rng.randint(10, 40)
+        if rng.random() < 0.05:
+            key_log.append((rng.choice('asdfghjkl'), timestamp + offset))
+        key_log.append((key, timestamp + offset))
+    for i in range(1, len(key_log)):
+        if key_log[i][1] < key_log[i - 1][1]:
+            key_log[i] = (key_log[i][0], key_log[i - 1][1])
+    return REPLAY_HEADER + ''.join(f'{key}|@|{timestamp}\n' for key, timestamp in key_log), len(key_log)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    replay, keystrokes = make_replay()
+    args = (flos_content, DURATION, BASE_KEY_SCORE, 1.0, 0, replay, DEFAULT_CONFIG)
+    claimed = recompute_stats(*args)
+    print(f'replay: {keystrokes} keystrokes, recomputed {claimed}')
+
+    start = perf_counter()
+    for _ in range(n):
+        verify_score(*args, claimed)
+    elapsed = perf_counter() - start
+    print(f'1 core: {n / elapsed:.1f} replays/s ({elapsed / n * 1000:.2f} ms each)')
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(verify_score, *zip(*[args + (claimed,)] * workers))) # warm up
+        start = perf_counter()
+        list(pool.map(verify_score, *zip(*[args + (claimed,)] * n)))
+        elapsed = perf_counter() - start
+    print(f'pool of {workers}: {n / elapsed:.1f} replays/s ({n / elapsed / workers:.1f} per core)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+rows/s dumped by the marshmallow schemas vs the compiled dump functions from serializers.py
+objects are built in memory like the ones api.py dumps (leaderboard scores with their user, mapsets with owner and diffs)
+and both outputs are checked to be equal first
+
+run from backend/: python benchmarks/serializers.py [beatmapsets]
+'''
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{directory}/data.db'
+os.environ['BLOB_DIR'] = f'{directory}/blobs'
+
+from models import Beatmap, Beatmapset, Score, User
+from schemas import beatmap_schema, beatmaps_schema, beatmapsets_schema, scores_schema, users_schema, \
+                    dump_beatmap, dump_beatmaps, dump_beatmapsets, dump_scores, dump_users
+
+def make_user(i):
+    user = User(id=f'{i}github', name=f'player{i}', avatar_url=f'https://avatars.githubusercontent.com/u/{i}')
+    user.play_count = i
+    return user
+
+def make_beatmap(i):
+    # no content, so beatmap_schema doesn't time reading blobs
+    return Beatmap(id=i, artist='ナナヒラ', title='Nanahira singing', artist_original='Nanahira', title_original='Nanahira',
+                   yt_id='dQw4w9WgXcQ', preview_point=30000, duration=120000, diffname=f'diff {i}', kpm=300.5,
+                   base_key_score=12.5)
+
+def make_data(num_beatmapsets):
+    users = [make_user(i) for i in range(50)]
+    scores = [Score(id=i, beatmap_id=1, score=1000000 - i, key_accuracy=0.99, kana_accuracy=0.98, time_unix=1700000000,
+                    speed_modification=1.0, mod_flag=0, user=users[i]) for i in range(50)]
+    beatmapsets = []
+    for i in range(num_beatmapsets):
+        beatmapsets.append(Beatmapset(id=i, name=f'mapset {i}', description='a description', icon_url='https://i.ytimg.com/x.jpg',
+                                      owner=users[i % 50], beatmaps=[make_beatmap(i * 3 + j) for j in range(3)]))
+    beatmaps = [beatmap for beatmapset in beatmapsets for beatmap in beatmapset.beatmaps]
+    return users, scores, beatmapsets, beatmaps
+
+def rate(dump, objs, rows, seconds=0.5):
+    n = 0
+    start = perf_counter()
+    while perf_counter() - start < seconds:
+        dump(objs)
+        n += 1
+    return n * rows / (perf_counter() - start)
+
+def main():
+    num_beatmapsets = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    users, scores, beatmapsets, beatmaps = make_data(num_beatmapsets)
+    cases = [
+        ('users_schema', users_schema.dump, dump_users, users, len(users)),
+        ('scores_schema (leaderboard)', scores_schema.dump, dump_scores, scores, len(scores)),
+        ('beatmap_schema', beatmap_schema.dump, dump_beatmap, beatmaps[0], 1),
+        ('beatmaps_schema', beatmaps_schema.dump, dump_beatmaps, beatmaps, len(beatmaps)),
+        ('beatmapsets_schema', beatmapsets_schema.dump, dump_beatmapsets, beatmapsets, len(beatmapsets)),
+    ]
+    print(f'{"schema":<30}{"marshmallow rows/s":>20}{"compiled rows/s":>18}{"speedup":>9}')
+    for name, before, after, objs, rows in cases:
+        assert before(objs) == after(objs), name
+        old, new = rate(before, objs, rows), rate(after, objs, rows)
+        print(f'{name:<30}{old:>20,.0f}{new:>18,.0f}{new / old:>8.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+'''
+read latency and write throughput with several processes sharing one sqlite file, like gunicorn workers
+compares a plain create_engine (rollback journal, no pool) against make_engine's pragmas,
+and against readers on their own mode=ro engine like the read_only routes
+
+run from backend/: python benchmarks/sqlite_concurrency.py [readers] [writers] [seconds]
+'''
+from multiprocessing import Process, Queue
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from database import Base, make_engine
+import models # registers the tables on Base
+
+NUM_BEATMAPS = 200
+NUM_SCORES = 50000
+
+LEADERBOARD = text('SELECT id, user_id, score FROM scores WHERE beatmap_id = :beatmap_id ORDER BY score DESC LIMIT 50')
+INSERT_SCORE = text('INSERT INTO scores (beatmap_id, user_id, score, key_accuracy, kana_accuracy, time_unix) '
+                    'VALUES (:beatmap_id, :user_id, :score, 1, 1, :time)')
+
+def read_only_url(url):
+    return url.replace('sqlite:///', 'sqlite:///file:', 1) + '?mode=ro&uri=true'
+
+# profile -> (reader engine, writer engine) for a url
+PROFILES = {
+    'default': (create_engine, create_engine),
+    'tuned': (make_engine, make_engine),
+    'split': (lambda url: make_engine(read_only_url(url)), make_engine),
+}
+
+def setup(path):
+    engine = create_engine(f'sqlite:///{path}')
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(INSERT_SCORE, [
+            { 'beatmap_id': random.randrange(NUM_BEATMAPS), 'user_id': str(random.randrange(1000)),
+              'score': random.randrange(100000), 'time': int(time()) }
+            for _ in range(NUM_SCORES)])
+    engine.dispose()
+
+def reader(profile, url, seconds, results):
+    engine = PROFILES[profile][0](url)
+    latencies, errors = [], 0
+    end = perf_counter() + seconds
+    while perf_counter() < end:
+        start = perf_counter()
+        try:
+            with engine.connect() as connection:
+                connection.execute(LEADERBOARD, { 'beatmap_id': random.randrange(NUM_BEATMAPS) }).fetchall()
+            latencies.append(perf_counter() - start)
+        except OperationalError:
+            errors += 1
+    results.put(('read', latencies, errors))
+
+def writer(profile, url, seconds, results):
+    engine = PROFILES[profile][1](url)
+    latencies, errors = [], 0
+    end = perf_counter() + seconds
+    while perf_counter() < end:
+        start = perf_counter()
+        try:
+            with engine.begin() as connection:
+                connection.execute(INSERT_SCORE, { 'beatmap_id': random.randrange(NUM_BEATMAPS),
+                    'user_id': str(random.randrange(1000)), 'score': random.randrange(100000), 'time': int(time()) })
+            latencies.append(perf_counter() - start)
+        except OperationalError:
+            errors += 1
+    results.put(('write', latencies, errors))
+
+def percentile(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))] * 1000 if xs else float('nan')
+
+def run(profile, path, readers, writers, seconds):
+    url = f'sqlite:///{path}'
+    results = Queue()
+    procs = [Process(target=reader, args=(profile, url, seconds, results)) for _ in range(readers)] + \
+            [Process(target=writer, args=(profile, url, seconds, results)) for _ in range(writers)]
+    for p in procs:
+        p.start()
+    collected = { 'read': ([], 0), 'write': ([], 0) }
+    for _ in procs:
+        kind, latencies, errors = results.get()
+        old_latencies, old_errors = collected[kind]
+        collected[kind] = (old_latencies + latencies, old_errors + errors)
+    for p in procs:
+        p.join()
+    for kind, (latencies, errors) in collected.items():
+        print(f'{profile:<9}{kind:<7}{len(latencies) / seconds:>9.0f}'
+              f'{percentile(latencies, 0.5):>9.2f}{percentile(latencies, 0.99):>9.2f}{errors:>8}')
+
+def main():
+    readers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    print(f'{readers} readers, {writers} writers, {seconds:g}s each')
+    print(f'{"profile":<9}{"op":<7}{"ops/s":>9}{"p50 ms":>9}{"p99 ms":>9}{"errors":>8}')
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in PROFILES:
+            path = os.path.join(directory, f'{profile}.db')
+            setup(path)
+            run(profile, path, readers, writers, seconds)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''
+requests/s for frontend files: flask's static route and send_static_file (before) vs static_files.py (after)
+uses a fake build with a 1.5 MB hashed bundle; bytes is what goes over the wire per request
+
+run from backend/: python benchmarks/static_files.py [seconds per case]
+'''
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{directory}/data.db'
+build = os.path.join(directory, 'build')
+os.environ['FRONTEND_BUILD_DIR'] = build
+
+from flask import Flask
+
+from app import app
+
+BUNDLE = 'bundle.0123456789abcdef0123.js'
+
+def make_build():
+    os.makedirs(build)
+    with open(os.path.join(build, BUNDLE), 'w') as f:
+        f.write(''.join(f'function f{i}(a, b) {{ return a + b * {i} }};\n' for i in range(40000)))
+    with open(os.path.join(build, 'index.html'), 'w') as f:
+        f.write(f'<!doctype html><html><head><script defer src="/static/{BUNDLE}"></script></head>'
+                '<body><div id="root"></div></body></html>')
+
+def old_app():
+    old = Flask(__name__, static_folder=build, static_url_path='/static/')
+    @old.route('/', defaults={'path': ''})
+    @old.route('/<path:path>')
+    def index(path):
+        return old.send_static_file('index.html')
+    return old
+
+def rate(client, url, headers, seconds):
+    n = 0
+    size = 0
+    start = perf_counter()
+    while perf_counter() - start < seconds:
+        res = client.get(url, headers=headers)
+        size = len(res.data)
+        n += 1
+    return n / (perf_counter() - start), size
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    make_build()
+    old, new = old_app().test_client(), app.test_client()
+    etag = new.get(f'/static/{BUNDLE}').headers['ETag']
+    # flask's static route only does Last-Modified
+    last_modified = old.get(f'/static/{BUNDLE}').headers['Last-Modified']
+    cases = [
+        ('bundle', f'/static/{BUNDLE}', {}, {}),
+        ('bundle, gzip accepted', f'/static/{BUNDLE}', { 'Accept-Encoding': 'gzip' }, { 'Accept-Encoding': 'gzip' }),
+        ('bundle, revalidated', f'/static/{BUNDLE}', { 'If-Modified-Since': last_modified }, { 'If-None-Match': etag }),
+        ('index.html', '/beatmaps/1', {}, {}),
+    ]
+    print(f'{"request":<24}{"before req/s":>14}{"bytes":>10}{"after req/s":>14}{"bytes":>10}')
+    for name, url, old_headers, new_headers in cases:
+        before, before_size = rate(old, url, old_headers, seconds)
+        after, after_size = rate(new, url, new_headers, seconds)
+        print(f'{name:<24}{before:>14,.0f}{before_size:>10}{after:>14,.0f}{after_size:>10}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+time per user search: the old ILIKE '%q%' filter (one page of 50, like paginate) vs search_users from user_search.py
+users get names like the ones oauth.py hands out: a word, sometimes with digits after it
+
+run from backend/: python benchmarks/user_search.py [users]
+'''
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{directory}/data.db'
+
+from sqlalchemy import insert
+
+from database import Base, db_session, engine
+from models import User
+from user_search import rebuild_user_search_index, search_users
+
+WORDS = ['kana', 'typer', 'sakura', 'neko', 'player', 'osu', 'miku', 'rin', 'yuki', 'tanuki', 'kitsune', 'hoshi',
+         'sora', 'kaze', 'ame', 'fast', 'slow', 'key', 'ninja', 'ppfarmer', 'songenjoyer', 'vekt0r']
+
+def make_names(n):
+    rng = random.Random(0)
+    names = set()
+    while len(names) < n:
+        name = rng.choice(WORDS) + rng.choice(['', '_', '']) + rng.choice(WORDS)
+        if rng.random() < 0.8:
+            name += str(rng.randrange(10 ** rng.randint(1, 6)))
+        names.add(name[:50])
+    return list(names)
+
+def old_search(search_query):
+    return [user.id for user in User.query.filter(User.name.ilike(f'%{search_query}%')).order_by(User.id).limit(51)]
+
+def new_search(search_query):
+    return search_users(db_session, search_query, 50)
+
+def time_per_call(search, search_query, seconds=0.5):
+    n = 0
+    start = perf_counter()
+    while perf_counter() - start < seconds:
+        search(search_query)
+        n += 1
+    return (perf_counter() - start) / n
+
+def main():
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    Base.metadata.create_all(engine)
+    names = make_names(num_users)
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{ 'id': f'{i}github', 'name': name, 'join_time': i } for i, name in enumerate(names)])
+        rebuild_user_search_index(connection)
+    queries = ['sakuraneko123', 'saku', 'ko', 'nekoki', 'tsune_ho', 'farmer9', 'zzzz']
+    print(f'{num_users:,} users')
+    print(f'{"query":<16}{"old ms":>10}{"new ms":>10}{"results":>9}  top 3')
+    for search_query in queries:
+        old, new = time_per_call(old_search, search_query), time_per_call(new_search, search_query)
+        ids = new_search(search_query)
+        top = [User.query.get(id).name for id in ids[:3]]
+        print(f'{search_query:<16}{old * 1000:>10.2f}{new * 1000:>10.3f}{len(ids):>9}  {", ".join(top)}')
+
+if __name__ == '__main__':
+    main()
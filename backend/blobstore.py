@@ -0,0 +1,69 @@
+'''
+content-addressed file storage for big payloads (beatmap content, replays)
+blobs live at BLOB_DIR/<first 2 hex chars>/<sha256 hex>, so identical data is stored once
+rows only keep the hash and length; see Beatmap.content and Replay.encoded_data
+'''
+from hashlib import sha256
+import mmap
+import os
+import tempfile
+from time import time
+
+BLOB_DIR = os.environ.get('BLOB_DIR', 'persistent/blobs')
+
+def blob_path(blob_hash):
+    return os.path.join(BLOB_DIR, blob_hash[:2], blob_hash)
+
+def put_blob(data):
+    '''
+    stores data (bytes) if it isn't already there; returns its sha256 hex digest
+    the file appears atomically, so readers never see a partial blob
+    '''
+    blob_hash = sha256(data).hexdigest()
+    path = blob_path(blob_hash)
+    if os.path.exists(path):
+        os.utime(path) # counts as new again for delete_blobs
+        return blob_hash
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return blob_hash
+
+def get_blob(blob_hash):
+    with open(blob_path(blob_hash), 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b'' # can't mmap an empty file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return m[:]
+
+def all_blob_hashes():
+    if not os.path.isdir(BLOB_DIR):
+        return
+    for prefix in os.listdir(BLOB_DIR):
+        directory = os.path.join(BLOB_DIR, prefix)
+        for name in os.listdir(directory):
+            if not name.startswith('.tmp-'):
+                yield name
+
+def delete_blobs(keep, min_age=3600):
+    '''
+    removes every blob whose hash isn't in keep; returns how many were removed
+    recent blobs are spared, since their rows may not be committed yet
+    '''
+    removed = 0
+    cutoff = time() - min_age
+    for blob_hash in list(all_blob_hashes()):
+        path = blob_path(blob_hash)
+        if blob_hash not in keep and os.path.getmtime(path) < cutoff:
+            os.unlink(path)
+            removed += 1
+    return removed
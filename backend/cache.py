@@ -0,0 +1,185 @@
+'''
+caches for the serialized bodies of hot GET responses (see etagged in api.py)
+entries are keyed by ETag, which comes from the version counters in data.db, so once any worker commits a write
+every worker's next request misses; invalidate only frees the old entries early
+RESPONSE_CACHE_URL picks where they live:
+  memory:// (default) a dict per worker
+  sqlite:///path      one file shared by every worker on the machine, so a response is built once per node
+'''
+from collections import OrderedDict
+import os
+from threading import Lock
+from time import monotonic, time
+
+from sqlalchemy import Column, Float, Index, Integer, LargeBinary, MetaData, String, Table, delete, func, select
+from sqlalchemy.exc import OperationalError
+
+from database import make_engine
+
+RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL', 'memory://')
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 64)) * 1024 * 1024 # MiB of response bodies; 0 disables
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 300)) # s
+
+class LRUCache:
+    '''
+    least recently used entries go first once the values add up to more than max_size bytes
+    every entry belongs to a group, e.g. 'beatmap:1337', and invalidate drops a whole group
+    '''
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict() # key -> (value, group, expires at)
+        self.groups = {} # group -> set of keys
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def get(self, key, count=True):
+        '''
+        count=False leaves hits and misses alone, for a lookup that's only part of one (see count)
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] < monotonic():
+                self._remove(key)
+                entry = None
+            if count:
+                self._count(entry is not None)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def count(self, hit):
+        with self.lock:
+            self._count(hit)
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def set(self, key, value, group):
+        if len(value) > self.max_size:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, group, monotonic() + self.ttl)
+            self.groups.setdefault(group, set()).add(key)
+            self.size += len(value)
+            while self.size > self.max_size:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, *groups):
+        with self.lock:
+            for group in groups:
+                for key in list(self.groups.get(group, ())):
+                    self._remove(key)
+
+    def _remove(self, key):
+        value, group, _ = self.entries.pop(key)
+        self.size -= len(value)
+        keys = self.groups[group]
+        keys.discard(key)
+        if not keys:
+            del self.groups[group]
+
+    def stats(self):
+        with self.lock:
+            return { 'backend': 'memory', 'entries': len(self.entries), 'size': self.size, 'max_size': self.max_size,
+                     'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions }
+
+metadata = MetaData()
+entries = Table('entries', metadata,
+    Column('key', String(64), primary_key=True), # ETag, or ETag.encoding
+    Column('grp', String(64), index=True),
+    Column('size', Integer),
+    Column('stored_at', Float),
+    Column('expires_at', Float, index=True),
+    Column('value', LargeBinary), # last, so reading the other columns doesn't walk its overflow pages
+    Index('ix_entries_eviction', 'stored_at', 'size', 'key'), # covers eviction
+)
+
+class SQLiteCache:
+    '''
+    same interface as LRUCache, in a sqlite file every worker opens
+    evicts the oldest stored entries rather than the least recently used, so hits stay read only
+    a cache that's busy or broken just misses; counters are this worker's
+    '''
+    def __init__(self, url, max_size, ttl):
+        self.engine = make_engine(url)
+        metadata.create_all(self.engine)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key, count=True):
+        try:
+            with self.engine.connect() as connection:
+                value = connection.execute(select(entries.c.value)
+                                           .where(entries.c.key == key, entries.c.expires_at >= time())).scalar()
+        except OperationalError:
+            self.errors += 1
+            value = None
+        if count:
+            self.count(value is not None)
+        return value
+
+    def count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def set(self, key, value, group):
+        if len(value) > self.max_size:
+            return
+        now = time()
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(entries.insert().prefix_with('OR REPLACE')
+                                   .values(key=key, grp=group, value=value, size=len(value),
+                                           stored_at=now, expires_at=now + self.ttl))
+                connection.execute(delete(entries).where(entries.c.expires_at < now))
+                if connection.execute(select(func.sum(entries.c.size))).scalar() > self.max_size:
+                    # newest first, everything past 90% of max_size goes, so this doesn't run on every set
+                    running_size = func.sum(entries.c.size).over(order_by=entries.c.stored_at.desc())
+                    overflow = select(entries.c.key, running_size.label('running_size')).subquery()
+                    connection.execute(delete(entries).where(entries.c.key.in_(
+                        select(overflow.c.key).where(overflow.c.running_size > self.max_size * 0.9))))
+        except OperationalError:
+            self.errors += 1
+
+    def invalidate(self, *groups):
+        if not groups:
+            return
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(delete(entries).where(entries.c.grp.in_(groups)))
+        except OperationalError:
+            self.errors += 1
+
+    def stats(self):
+        try:
+            with self.engine.connect() as connection:
+                count, size = connection.execute(select(func.count(), func.coalesce(func.sum(entries.c.size), 0))).one()
+        except OperationalError:
+            count = size = None
+        return { 'backend': 'sqlite', 'entries': count, 'size': size, 'max_size': self.max_size,
+                 'hits': self.hits, 'misses': self.misses, 'errors': self.errors }
+
+def make_cache(url=RESPONSE_CACHE_URL, max_size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+    if url.startswith('memory:') or max_size <= 0:
+        return LRUCache(max_size, ttl)
+    if url.startswith('sqlite:'):
+        return SQLiteCache(url, max_size, ttl)
+    raise ValueError(f'Unsupported RESPONSE_CACHE_URL: {url}')
+
+response_cache = make_cache()
@@ -0,0 +1,62 @@
+'''
+gzip and brotli Content-Encoding, picked from Accept-Encoding
+brotli is used if the brotli package is installed, and gzip otherwise
+api responses are compressed once they reach COMPRESSION_MIN_SIZE bytes
+responses cached by etagged in api.py keep their compressed bodies in the response cache too,
+so a beatmap is compressed once per version rather than once per request
+'''
+import gzip
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)) # bytes
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6)) # 1-9
+BROTLI_LEVEL = int(os.environ.get('BROTLI_LEVEL', 5)) # 0-11; past ~5 it gets slow for compressing per request
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',) # preferred first
+
+def accepted_encoding(available=ENCODINGS):
+    '''
+    the best of available that the current request accepts, or None
+    '''
+    for encoding in available:
+        if request.accept_encodings.quality(encoding) > 0:
+            return encoding
+    return None
+
+def compress(data, encoding, level=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_LEVEL if level is None else level)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL if level is None else level, mtime=0)
+
+def set_encoding(response, encoding):
+    '''
+    marks response as encoded; its ETag becomes weak, since it's the same resource in a different representation
+    '''
+    response.headers['Content-Encoding'] = encoding
+    etag, _ = response.get_etag()
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+
+def compress_response(response):
+    '''
+    after_request hook: compresses large JSON responses if the client takes it
+    '''
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+            or 'Content-Encoding' in response.headers or response.mimetype != 'application/json':
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
+    if encoding is not None:
+        response.set_data(compress(data, encoding))
+        set_encoding(response, encoding)
+    return response
@@ -1,10 +1,87 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
+from functools import wraps
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
+
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///persistent/data.db')
+# same file opened with mode=ro, so reads can never take a write lock
+READ_DATABASE_URL = os.environ.get('READ_DATABASE_URL',
+    DATABASE_URL.replace('sqlite:///', 'sqlite:///file:', 1) + '?mode=ro&uri=true'
+    if DATABASE_URL.startswith('sqlite:///') else DATABASE_URL)
+
+# applied to every new connection; see https://www.sqlite.org/pragma.html
+# WAL lets readers in other workers keep going while a score is being committed
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'), # durable enough with WAL, and no fsync per commit
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)), # ms to wait on a lock before 'database is locked'
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)), # negative is KiB
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 5))
+
+def make_engine(url=DATABASE_URL, pragmas=SQLITE_PRAGMAS, pool_size=SQLITE_POOL_SIZE, **kwargs):
+    '''
+    create_engine, plus the pragmas on every sqlite connection
+    connections are pooled so the per-connection cache and mmap outlive a request
+    '''
+    if not url.startswith('sqlite'):
+        return create_engine(url, **kwargs)
+    engine = create_engine(url, poolclass=QueuePool, pool_size=pool_size,
+                           connect_args={ 'check_same_thread': False }, **kwargs)
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if name == 'journal_mode' and 'mode=ro' in url:
+                continue # a property of the file, which read only connections can't change
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+        # let sqlalchemy emit BEGIN itself (below), or pysqlite breaks savepoints
+        # https://docs.sqlalchemy.org/en/14/dialects/sqlite.html#serializable-isolation-savepoints-transactional-ddl
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        connection.exec_driver_sql(connection.get_execution_options().get('sqlite_begin', 'BEGIN'))
+
+    return engine
+
+class RoutingSession(Session):
+    '''
+    uses read_engine while session.info['read_only'] is set (see read_only), engine otherwise
+    '''
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.info.get('read_only'):
+            return read_engine
+        return super().get_bind(mapper, clause, **kwargs)
+
+def read_only(f):
+    '''
+    runs f with db_session on the read only engine, so it never waits on (or blocks) a writer
+    put it right under the route, before anything that queries
+    '''
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        session = db_session()
+        session.info['read_only'] = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            session.close() # give back the read connection, later writes get a fresh transaction
+            session.info.pop('read_only', None)
+    return wrapper
 
-# Database engine
-engine = create_engine('sqlite:///persistent/data.db')
-db_session = scoped_session(sessionmaker(autocommit=False,
+# Database engines
+engine = make_engine()
+read_engine = make_engine(READ_DATABASE_URL) if READ_DATABASE_URL != DATABASE_URL else engine
+db_session = scoped_session(sessionmaker(class_=RoutingSession,
+                                         autocommit=False,
                                          autoflush=False,
                                          bind=engine))
 
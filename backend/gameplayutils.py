@@ -0,0 +1,292 @@
+'''
+port of the scoring half of frontend/src/utils/gameplayutils.ts (makeUpdateGameState, simulateReplay)
+lets the server recompute a score from its replay instead of trusting the client
+keep this in sync with the frontend whenever scoring changes!
+'''
+from beatmaputils import parse_int
+from kana import DEFAULT_CONFIG, parse_kana, compute_min_keypresses
+
+REPLAY_HEADER = 'enuTyping replay format v1\n'
+
+# don't lowercase because maps might have uppercase
+ALLOWED_CHARACTERS = \
+    "`1234567890-=qwertyuiop[]\\asdfghjkl;'zxcvbnm,./~!@#$%^&*()_+QWERTYUIOP{}|ASDFGHJKL:\"ZXCVBNM<>?"
+
+HIDDEN_MOD = 1
+
+class Stats:
+    __slots__ = ('hits', 'misses', 'kana_hits', 'kana_misses', 'total_kana', 'score')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.kana_hits = 0
+        self.kana_misses = 0
+        self.total_kana = 0
+        self.score = 0
+
+class KanaState:
+    __slots__ = ('kana', 'prefix', 'suffix', 'min_keypresses', 'score_ratio', 'misses')
+
+    def __init__(self, kana, last):
+        full_text = kana.romanizations[0]
+        self.kana = kana
+        self.prefix = full_text if last else ''
+        self.suffix = '' if last else full_text
+        self.min_keypresses = compute_min_keypresses(kana)
+        self.score_ratio = 0
+        self.misses = 0
+
+class SyllableState:
+    __slots__ = ('time', 'text', 'position', 'kana')
+
+    def __init__(self, time, text, kana):
+        self.time = time
+        self.text = text
+        self.position = 0
+        self.kana = kana
+
+class LineState:
+    __slots__ = ('start_time', 'end_time', 'syllable_times', 'total_kana', 'position', 'syllables', 'n_buffer')
+
+    def __init__(self, line, config):
+        start_time, end_time, _, syllables = line
+        self.start_time = start_time
+        self.end_time = end_time
+        self.syllable_times = [time for time, _ in syllables]
+        self.total_kana = sum(len(parse_kana(text, config)) for _, text in syllables)
+        self.position = sum(1 for time, _ in syllables if time < 0)
+        self.syllables = []
+        for i, (time, text) in enumerate(syllables):
+            next_text = syllables[i + 1][1] if i + 1 < len(syllables) else None
+            kana = [KanaState(k, time < 0) for k in parse_kana(text, config, next_text)]
+            self.syllables.append(SyllableState(time, text, kana))
+        self.n_buffer = None
+
+class GameState:
+    __slots__ = ('lines', 'stats')
+
+    def __init__(self, lines, config):
+        self.lines = [LineState(line, config) for line in lines]
+        self.stats = Stats()
+
+def get_score_multiplier(speed, mod_flag):
+    if speed < 0:
+        raise ValueError('speed cannot be negative')
+    mult = speed ** 1.5 if speed < 1 else speed ** 0.4
+    if mod_flag & HIDDEN_MOD:
+        mult *= 1.05
+    return mult
+
+GRADES = ['SS', 'S', 'A', 'B', 'C', 'D', 'E']
+# lowest normalized score for each grade between SS and E
+GRADE_THRESHOLDS = [('S', 980000), ('A', 900000), ('B', 750000), ('C', 500000), ('D', 250000)]
+
+def get_grade(score, speed, mod_flag):
+    '''
+    same as getRank in the frontend's gameplayutils.ts
+    '''
+    mult = get_score_multiplier(speed, mod_flag) if speed > 0 else 0
+    normalized_score = score / mult if mult else 0
+    if normalized_score == 1000000:
+        return 'SS'
+    for grade, threshold in GRADE_THRESHOLDS:
+        if normalized_score >= threshold:
+            return grade
+    return 'E'
+
+def time_to_line_index(lines, time):
+    '''
+    -1 to len(lines)
+    '''
+    if not lines or time < lines[0].start_time:
+        return -1
+    for i, line in enumerate(lines):
+        if time < line.end_time:
+            return i
+    return len(lines)
+
+def time_to_syllable_index(syllable_times, time):
+    '''
+    0 to len(syllable_times)
+    '''
+    for i, syllable_time in enumerate(syllable_times):
+        if time < syllable_time:
+            return i
+    return len(syllable_times)
+
+def update_state_on_line_end(game_state, line_index):
+    '''
+    fixes leftover total kana amounts; line_index is the line after the one that ended
+    '''
+    total_kana = sum(line.total_kana for line in game_state.lines[:line_index])
+    game_state.stats.total_kana = total_kana
+    game_state.stats.kana_misses = total_kana - game_state.stats.kana_hits
+
+def get_kana(line_state, s_pos):
+    if s_pos >= len(line_state.syllables):
+        return None
+    syllable = line_state.syllables[s_pos]
+    if syllable.position >= len(syllable.kana):
+        return None
+    return syllable.kana[syllable.position]
+
+def update_kana_affix(key, cur_kana):
+    '''
+    returns the new (prefix, suffix) if key continues cur_kana, otherwise None
+    '''
+    if cur_kana is None:
+        return None
+    new_prefix = cur_kana.prefix + key
+    for option in cur_kana.kana.romanizations:
+        if option.startswith(new_prefix):
+            return new_prefix, option[len(new_prefix):]
+    return None
+
+def calc_score_and_update_stats(kana_state, stats, base_key_score, score_multiplier, hit, miss, end_kana, error):
+    effective_error = -3 * error if error < 0 else error # penalize early hits more
+    effective_error = max(0, effective_error - 90) # gives 120ms perfect window
+    timing_multiplier = 0.2 + 0.8 * 0.5 ** (effective_error / 1000)
+    judgement = hit * timing_multiplier
+    inc_kana = 1 if end_kana else 0
+    stats.hits += hit
+    stats.misses += miss
+    stats.kana_hits += inc_kana
+    stats.total_kana += inc_kana
+    stats.score += judgement * base_key_score * score_multiplier
+    kana_state.score_ratio += judgement
+    kana_state.misses += miss
+
+def make_update_game_state(base_key_score, score_multiplier):
+    def update_game_state(game_state, key, timestamp):
+        lines = game_state.lines
+        curr_index = time_to_line_index(lines, timestamp)
+        if not 0 <= curr_index < len(lines):
+            return
+        line_state = lines[curr_index]
+        s_pos = line_state.position
+        cur_kana = get_kana(line_state, s_pos)
+        if cur_kana is None:
+            return # finished line or something
+
+        syllables = line_state.syllables
+        if key not in ALLOWED_CHARACTERS:
+            return
+        if key == 'n' and line_state.n_buffer is not None:
+            n_s_pos, n_k_pos = line_state.n_buffer
+            line_state.n_buffer = None
+            syllables[n_s_pos].kana[n_k_pos].prefix += 'n'
+            return
+
+        latest_active_syllable = time_to_syllable_index(line_state.syllable_times, timestamp) - 1
+        error = timestamp - syllables[s_pos].time
+
+        new_kana = cur_kana
+        affix = update_kana_affix(key, cur_kana)
+        if affix is None:
+            # key is not the next char
+            # game will skip to a syllable if the key matches, and:
+            # - the current time is past the syllable start time, or
+            # - the misses on this kana, if they were hits, could be
+            #   enough keystrokes so player would be at this syllable
+            keystrokes_burned = cur_kana.misses - len(cur_kana.suffix)
+            cur_syllable = syllables[s_pos]
+            keystrokes_burned -= sum(k.min_keypresses for k in cur_syllable.kana[cur_syllable.position + 1:])
+            for new_pos in range(s_pos + 1, len(syllables)):
+                if new_pos > latest_active_syllable and keystrokes_burned < 0:
+                    break
+                keystrokes_burned -= sum(k.min_keypresses for k in syllables[new_pos].kana)
+                test_kana = get_kana(line_state, new_pos)
+                affix = update_kana_affix(key, test_kana)
+                if affix is not None:
+                    s_pos = new_pos
+                    new_kana = test_kana
+                    break
+
+        hit = miss = 0
+        if affix is not None:
+            new_kana.prefix, new_kana.suffix = affix
+            if len(new_kana.prefix) == 1:
+                hit = 1 # first hit
+            if new_kana.suffix == '':
+                hit += new_kana.min_keypresses - 1 # last hit
+        else:
+            miss = 1
+        end_kana = new_kana.suffix == ''
+        calc_score_and_update_stats(new_kana, game_state.stats, base_key_score, score_multiplier, hit, miss, end_kana, error)
+
+        if end_kana:
+            syllable = syllables[s_pos]
+            line_state.n_buffer = (s_pos, syllable.position) \
+                if new_kana.prefix == 'n' and new_kana.kana.text == 'ん' else None
+            syllable.position += 1
+            if syllable.position >= len(syllable.kana):
+                s_pos += 1
+            # if get_kana(position) is still None, line is over
+        line_state.position = s_pos
+    return update_game_state
+
+def simulate_replay(lines, base_key_score, score_multiplier, key_log, config=DEFAULT_CONFIG):
+    '''
+    lines as returned by beatmaputils.parse_beatmap; key_log is [(key, timestamp), ...]
+    '''
+    game_state = GameState(lines, config)
+    update_game_state = make_update_game_state(base_key_score or 1, score_multiplier)
+    if not lines:
+        return game_state
+    curr_index = 0
+    log_index = 0 # next index to process
+    while True:
+        curr_line = game_state.lines[curr_index]
+        if log_index < len(key_log) and key_log[log_index][1] < curr_line.end_time:
+            # next keypress comes next, chronologically
+            key, timestamp = key_log[log_index]
+            update_game_state(game_state, key, timestamp)
+            log_index += 1
+        else:
+            # end of line comes next, chronologically
+            curr_index += 1 # want to pass in the next line
+            if curr_index == len(lines):
+                break
+            update_state_on_line_end(game_state, curr_index)
+    return game_state
+
+def final_stats(game_state):
+    '''
+    what GameArea submits: stats after the last line ends
+    '''
+    update_state_on_line_end(game_state, len(game_state.lines))
+    stats = game_state.stats
+    keys = stats.hits + stats.misses
+    return {
+        'score': int(stats.score + 0.5), # js Math.round
+        'key_accuracy': stats.hits / keys if keys else None,
+        'kana_accuracy': stats.kana_hits / stats.total_kana if stats.total_kana else None,
+    }
+
+def serialize_replay(key_log):
+    # timestamps should be int, but just in case
+    return REPLAY_HEADER + ''.join(f'{key}|@|{int(timestamp + 0.5)}\n' for key, timestamp in key_log)
+
+def deserialize_replay(replay):
+    key_log = []
+    for line in replay.split('\n'):
+        data = line.split('|@|')
+        if len(data) != 2:
+            continue
+        timestamp = parse_int(data[1])
+        if timestamp is not None:
+            key_log.append((data[0], timestamp))
+    return key_log
+
+def simulate_perfect_replay(lines, config=DEFAULT_CONFIG):
+    '''
+    key log of typing the first romanization of every kana exactly on time
+    '''
+    key_log = []
+    for _, _, _, syllables in lines:
+        for time, text in syllables:
+            for kana in parse_kana(text, config):
+                for c in kana.romanizations[0]:
+                    key_log.append((c, time))
+    return key_log
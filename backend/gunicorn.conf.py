@@ -0,0 +1,8 @@
+# gunicorn only reads this by itself when started from backend/; from anywhere else (--chdir doesn't count)
+# pass it with -c, as the Dockerfile does
+import os
+
+# more than one thread switches gunicorn to its gthread worker, so a request waiting on a login provider
+# holds one thread instead of a whole worker; oauth.py caps how many of them logins can take (LOGIN_CONCURRENCY)
+# workers still come from WEB_CONCURRENCY or -w
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
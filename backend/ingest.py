@@ -0,0 +1,115 @@
+'''
+queued score submission, for SCORE_INGESTION=queued
+/api/scores only validates, appends the payload to a ticket table in its own sqlite file and answers 202;
+a consumer thread claims whatever is queued and saves it all in one writer unit,
+so the burst at the end of a popular map is a few commits instead of one per player
+tickets keep the response new_score would have given, for GET /api/scores/tickets/<id>
+'''
+import json
+import os
+from threading import Event, Lock, Thread
+from time import sleep, time
+from uuid import uuid4
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, and_, or_, select
+
+from database import make_engine
+
+SCORE_INGESTION = os.environ.get('SCORE_INGESTION', 'sync')
+SCORE_QUEUE_URL = os.environ.get('SCORE_QUEUE_URL', 'sqlite:///persistent/score_queue.db')
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 256))
+INGEST_POLL_INTERVAL = 1 # s, only matters for tickets queued by other workers
+STALE_CLAIM = 60 # s before a claimed ticket is assumed to belong to a dead worker
+FINISH_ATTEMPTS = 5
+
+metadata = MetaData()
+tickets = Table('tickets', metadata,
+    Column('id', String(32), primary_key=True),
+    Column('user_id', String(69)),
+    Column('payload', Text), # json: the score fields, replay_data and time_unix
+    Column('status', String(10), index=True), # queued, claimed, done
+    Column('created_at', Float),
+    Column('claimed_at', Float),
+    Column('status_code', Integer), # what new_score would have answered
+    Column('result', Text), # json
+)
+
+queue_engine = make_engine(SCORE_QUEUE_URL)
+
+_wake = Event()
+_lock = Lock()
+_consumer_pid = None
+
+def enqueue(user_id, payload):
+    '''
+    durably queues a validated submission; returns its ticket id
+    '''
+    ticket_id = uuid4().hex
+    with queue_engine.begin() as connection:
+        connection.execute(tickets.insert().values(id=ticket_id, user_id=user_id, payload=json.dumps(payload),
+                                                   status='queued', created_at=time()))
+    _wake.set()
+    return ticket_id
+
+def get_ticket(ticket_id):
+    with queue_engine.connect() as connection:
+        return connection.execute(select(tickets).where(tickets.c.id == ticket_id)).one_or_none()
+
+def claim_batch():
+    now = time()
+    claimable = or_(tickets.c.status == 'queued',
+                    and_(tickets.c.status == 'claimed', tickets.c.claimed_at < now - STALE_CLAIM))
+    # BEGIN IMMEDIATE, so two workers can't claim the same tickets
+    with queue_engine.connect().execution_options(sqlite_begin='BEGIN IMMEDIATE') as connection:
+        with connection.begin():
+            rows = connection.execute(select(tickets).where(claimable)
+                                      .order_by(tickets.c.created_at).limit(INGEST_BATCH_SIZE)).all()
+            if rows:
+                connection.execute(tickets.update().where(tickets.c.id.in_([row.id for row in rows]))
+                                   .values(status='claimed', claimed_at=now))
+    return rows
+
+def finish(results):
+    '''
+    results: {ticket id: (result, status code)}
+    '''
+    with queue_engine.begin() as connection:
+        for ticket_id, (result, status_code) in results.items():
+            connection.execute(tickets.update().where(tickets.c.id == ticket_id)
+                               .values(status='done', status_code=status_code, result=json.dumps(result)))
+
+def start_consumer(save_batch):
+    '''
+    save_batch takes [(ticket id, user id, payload)] and returns {ticket id: (result, status code)}
+    it has to be safe to call again for tickets it already saved, in case a worker dies in between
+    '''
+    global _consumer_pid
+    with _lock:
+        if _consumer_pid == os.getpid():
+            return
+        _consumer_pid = os.getpid()
+    metadata.create_all(queue_engine)
+    Thread(target=_run, args=(save_batch,), name='score-ingest', daemon=True).start()
+
+def _run(save_batch):
+    while True:
+        _wake.clear()
+        try:
+            rows = claim_batch()
+        except Exception:
+            rows = [] # most likely busy; try again later
+        if not rows:
+            _wake.wait(INGEST_POLL_INTERVAL)
+            continue
+        try:
+            results = save_batch([(row.id, row.user_id, json.loads(row.payload)) for row in rows])
+        except Exception:
+            continue # left claimed, so it's retried once the claim goes stale
+        for attempt in range(FINISH_ATTEMPTS):
+            try:
+                finish(results)
+                break
+            except Exception:
+                sleep(INGEST_POLL_INTERVAL * (attempt + 1)) # most likely busy
+        # if it never goes through, the tickets stay claimed and the stale claim retry answers them:
+        # save_batch finds the scores already saved by ticket id
@@ -0,0 +1,210 @@
+'''
+port of frontend/src/utils/kana.ts, for simulating replays on the server
+includes just enough of wanakana's toRomaji (v4) to romanize hiragana/katakana the same way
+only the romaji layout is ported, since kana layout scores don't get submitted
+'''
+from functools import lru_cache
+
+BASIC_ROMAJI = {
+    'あ': 'a', 'い': 'i', 'う': 'u', 'え': 'e', 'お': 'o',
+    'か': 'ka', 'き': 'ki', 'く': 'ku', 'け': 'ke', 'こ': 'ko',
+    'さ': 'sa', 'し': 'shi', 'す': 'su', 'せ': 'se', 'そ': 'so',
+    'た': 'ta', 'ち': 'chi', 'つ': 'tsu', 'て': 'te', 'と': 'to',
+    'な': 'na', 'に': 'ni', 'ぬ': 'nu', 'ね': 'ne', 'の': 'no',
+    'は': 'ha', 'ひ': 'hi', 'ふ': 'fu', 'へ': 'he', 'ほ': 'ho',
+    'ま': 'ma', 'み': 'mi', 'む': 'mu', 'め': 'me', 'も': 'mo',
+    'ら': 'ra', 'り': 'ri', 'る': 'ru', 'れ': 're', 'ろ': 'ro',
+    'や': 'ya', 'ゆ': 'yu', 'よ': 'yo',
+    'わ': 'wa', 'ゐ': 'wi', 'ゑ': 'we', 'を': 'wo',
+    'ん': 'n',
+    'が': 'ga', 'ぎ': 'gi', 'ぐ': 'gu', 'げ': 'ge', 'ご': 'go',
+    'ざ': 'za', 'じ': 'ji', 'ず': 'zu', 'ぜ': 'ze', 'ぞ': 'zo',
+    'だ': 'da', 'ぢ': 'ji', 'づ': 'zu', 'で': 'de', 'ど': 'do',
+    'ば': 'ba', 'び': 'bi', 'ぶ': 'bu', 'べ': 'be', 'ぼ': 'bo',
+    'ぱ': 'pa', 'ぴ': 'pi', 'ぷ': 'pu', 'ぺ': 'pe', 'ぽ': 'po',
+    'ゔぁ': 'va', 'ゔぃ': 'vi', 'ゔ': 'vu', 'ゔぇ': 've', 'ゔぉ': 'vo',
+}
+SPECIAL_SYMBOLS = {
+    '。': '.', '、': ',', '：': ':', '・': '/', '！': '!', '？': '?', '〜': '~', 'ー': '-',
+    '「': '‘', '」': '’', '『': '“', '』': '”', '［': '[', '］': ']',
+    '（': '(', '）': ')', '｛': '{', '｝': '}', '　': ' ',
+}
+AMBIGUOUS_VOWELS = ['あ', 'い', 'う', 'え', 'お', 'や', 'ゆ', 'よ']
+SMALL_Y = { 'ゃ': 'ya', 'ゅ': 'yu', 'ょ': 'yo' }
+SMALL_Y_EXTRA = { 'ぃ': 'yi', 'ぇ': 'ye' }
+SMALL_AIUEO = { 'ぁ': 'a', 'ぃ': 'i', 'ぅ': 'u', 'ぇ': 'e', 'ぉ': 'o' }
+YOON_KANA = ['き', 'に', 'ひ', 'み', 'り', 'ぎ', 'び', 'ぴ', 'ゔ', 'く', 'ふ']
+YOON_EXCEPTIONS = { 'し': 'sh', 'ち': 'ch', 'じ': 'j', 'ぢ': 'j' }
+SMALL_KANA = { 'っ': '', 'ゃ': 'ya', 'ゅ': 'yu', 'ょ': 'yo', 'ぁ': 'a', 'ぃ': 'i', 'ぅ': 'u', 'ぇ': 'e', 'ぉ': 'o' }
+SOKUON_WHITELIST = {
+    'b': 'b', 'c': 't', 'd': 'd', 'f': 'f', 'g': 'g', 'h': 'h', 'j': 'j', 'k': 'k', 'm': 'm',
+    'p': 'p', 'q': 'q', 'r': 'r', 's': 's', 't': 't', 'v': 'v', 'w': 'w', 'x': 'x', 'z': 'z',
+}
+
+def make_kana_to_romaji_map():
+    '''
+    wanakana's kana -> hepburn tree, flattened to {kana: romaji}
+    every prefix of a key is also a key, so greedy longest match walks it the same way
+    '''
+    mapping = dict(BASIC_ROMAJI)
+    mapping.update(SPECIAL_SYMBOLS)
+    mapping.update(SMALL_Y)
+    mapping.update(SMALL_AIUEO)
+    for kana in YOON_KANA:
+        first = mapping[kana][0]
+        for y_kana, y_roma in { **SMALL_Y, **SMALL_Y_EXTRA }.items():
+            mapping[kana + y_kana] = first + y_roma
+    for kana, roma in YOON_EXCEPTIONS.items():
+        for y_kana, y_roma in SMALL_Y.items():
+            mapping[kana + y_kana] = roma + y_roma[1]
+        mapping[kana + 'ぃ'] = roma + 'yi'
+        mapping[kana + 'ぇ'] = roma + 'e'
+    # っ doubles the consonant of whatever comes next (っち -> tchi)
+    for kana, roma in list(mapping.items()):
+        mapping['っ' + kana] = SOKUON_WHITELIST.get(roma[:1], '') + roma
+    mapping.update(SMALL_KANA)
+    for kana in AMBIGUOUS_VOWELS:
+        mapping['ん' + kana] = "n'" + mapping[kana]
+    return mapping
+
+KANA_TO_ROMAJI = make_kana_to_romaji_map()
+MAX_KEY_LENGTH = max(map(len, KANA_TO_ROMAJI))
+
+KATAKANA_START, KATAKANA_END = ord('ァ'), ord('ヶ')
+HIRAGANA_SHIFT = ord('ぁ') - ord('ァ')
+KANA_AS_SYMBOL = ('ヵ', 'ヶ')
+
+def katakana_to_hiragana(s):
+    return ''.join(
+        chr(ord(c) + HIRAGANA_SHIFT)
+        if KATAKANA_START <= ord(c) <= KATAKANA_END and c not in KANA_AS_SYMBOL else c
+        for c in s)
+
+_romaji_maps = {}
+
+def get_romaji_map(custom_mapping):
+    key = tuple(sorted(custom_mapping.items()))
+    if key not in _romaji_maps:
+        _romaji_maps[key] = { **KANA_TO_ROMAJI, **custom_mapping }
+    return _romaji_maps[key]
+
+def to_romaji(s, custom_mapping={}):
+    '''
+    wanakana.toRomaji(s, { customRomajiMapping }), ignoring long vowel marks
+    '''
+    mapping = get_romaji_map(custom_mapping)
+    s = katakana_to_hiragana(s)
+    out = []
+    i = 0
+    while i < len(s):
+        for length in range(min(MAX_KEY_LENGTH, len(s) - i), 0, -1):
+            chunk = s[i:i + length]
+            if chunk in mapping:
+                out.append(mapping[chunk])
+                break
+        else:
+            length = 1
+            out.append(s[i])
+        i += length
+    return ''.join(out)
+
+SMALL_KANA_CHARS = ['ょ', 'ゃ', 'ゅ', 'ぃ', 'ぇ', 'ぁ', 'ぉ', 'ぅ']
+
+KANA_RESPELLINGS = {
+    'し': ['shi', 'si', 'ci'],
+    'ち': ['chi', 'ti'],
+    'つ': ['tsu', 'tu'],
+    'じ': ['ji', 'zi'],
+    'しゃ': ['sha', 'sya'],
+    'しょ': ['sho', 'syo'],
+    'しゅ': ['shu', 'syu'],
+    'じゃ': ['ja', 'jya', 'zya'],
+    'じょ': ['jo', 'jyo', 'zyo'],
+    'じゅ': ['ju', 'jyu', 'zyu'],
+    'か': ['ka', 'ca'],
+    'く': ['ku', 'cu', 'qu'],
+    'こ': ['ko', 'co'],
+    'せ': ['se', 'ce'],
+    'ふ': ['fu', 'hu'],
+    'づ': ['du'],
+    'ん': ['n', 'nn'],
+}
+
+# defaultConfig() in frontend/src/providers/config.tsx
+DEFAULT_CONFIG = {
+    'type_polygraphs': True,
+    'kana_spellings': {
+        'し': 'shi', 'ち': 'chi', 'つ': 'tsu', 'じ': 'ji',
+        'しゃ': 'sha', 'しょ': 'sho', 'しゅ': 'shu',
+        'じゃ': 'ja', 'じょ': 'jo', 'じゅ': 'ju',
+        'か': 'ka', 'く': 'ku', 'こ': 'ko', 'せ': 'se',
+        'ふ': 'fu', 'づ': 'du', 'ん': 'n',
+    },
+}
+
+class Kana:
+    __slots__ = ('text', 'romanizations')
+
+    def __init__(self, text, romanizations):
+        self.text = text
+        self.romanizations = romanizations
+
+def get_romanizations(kana, config):
+    kana = kana.lower()
+    spellings = config['kana_spellings']
+    canonical = to_romaji(kana, spellings)
+    if len(kana) == 1:
+        return [canonical] + KANA_RESPELLINGS.get(kana, [])
+
+    # small tsu case
+    if kana[0] == 'っ':
+        sub_romanizations = get_romanizations(kana[1:], config)
+        if config['type_polygraphs']:
+            return [x for r in sub_romanizations for x in (r[:1] + r, 'xtu' + r, 'xtsu' + r)]
+        return [r[:1] + r for r in sub_romanizations]
+
+    # all that's left after the first 2 cases is combinations e.g. きょ
+    normals = [canonical] + KANA_RESPELLINGS.get(kana, [])
+    if not config['type_polygraphs']:
+        return normals
+    modifier_romaji = to_romaji(kana[1], spellings)
+    weirds = [r + 'x' + modifier_romaji for r in get_romanizations(kana[0], config)]
+    return normals + weirds
+
+def compute_kana_at(pos, config, syllable, next_syllable=None):
+    if pos >= len(syllable):
+        return Kana('', [])
+    length = 1
+    if syllable[pos] == 'っ':
+        length += 1
+    if syllable[pos + length:pos + length + 1] in SMALL_KANA_CHARS:
+        length += 1
+    # n's are doubled before あ、な、や etc., carrying across syllables, but not across lines
+    future = syllable[pos + length:]
+    if future == '':
+        future = 'a' if next_syllable is None else next_syllable # want end of line to be doubled
+    is_doubled_n = to_romaji(future, config['kana_spellings'])[:1] in tuple('aeiouny')
+    text = syllable[pos:pos + length]
+    if syllable[pos] == 'ん' and is_doubled_n:
+        return Kana(text, ['nn'])
+    return Kana(text, get_romanizations(text, config))
+
+def parse_kana(syllable, config, next_syllable=None):
+    # the same syllables come up over and over (and in every replay of a map)
+    key = (config['type_polygraphs'], tuple(sorted(config['kana_spellings'].items())))
+    return _parse_kana(syllable, next_syllable, key)
+
+@lru_cache(maxsize=65536)
+def _parse_kana(syllable, next_syllable, config_key):
+    type_polygraphs, kana_spellings = config_key
+    config = { 'type_polygraphs': type_polygraphs, 'kana_spellings': dict(kana_spellings) }
+    kana = []
+    pos = 0
+    while pos < len(syllable):
+        new_kana = compute_kana_at(pos, config, syllable, next_syllable)
+        kana.append(new_kana)
+        pos += len(new_kana.text)
+    return tuple(kana)
+
+def compute_min_keypresses(kana):
+    return min(len(s) for s in kana.romanizations)
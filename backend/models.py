@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Float, UnicodeText, ForeignKey
-from sqlalchemy.orm import deferred, relationship
+from sqlalchemy import Column, Boolean, Integer, JSON, String, Float, ForeignKey, Index, func, insert, select
+from sqlalchemy.orm import relationship
 from time import time
 from database import Base
+from blobstore import get_blob, put_blob
+from replayutils import encode_replay, decode_replay
 
 class User(Base):
     __tablename__ = 'users'
@@ -11,9 +13,12 @@ class User(Base):
     avatar_url = Column(String(100))
     scores = relationship('Score', lazy="dynamic", order_by="desc(Score.id)", back_populates='user')
     beatmapsets = relationship('Beatmapset', back_populates='owner')
+    profile = relationship('UserProfile', uselist=False)
     join_time = Column(Integer())
-    key_accuracy = Column(Float())
-    kana_accuracy = Column(Float())
+    # sums over all of the user's scores, so a new score is a single UPDATE x = x + ?
+    # averages are worked out when dumping, see UserStats
+    key_accuracy_sum = Column(Float())
+    kana_accuracy_sum = Column(Float())
     total_score = Column(Integer())
     play_count = Column(Integer())
 
@@ -22,15 +27,18 @@ class User(Base):
         self.name = name
         self.avatar_url = avatar_url
         self.join_time = time()
-        self.key_accuracy = 1
-        self.kana_accuracy = 1
+        self.key_accuracy_sum = 0
+        self.kana_accuracy_sum = 0
         self.total_score = 0
         self.play_count = 0
 
+# exact and prefix matches for user search; see user_search.py
+Index('ix_users_name_nocase', User.name.collate('NOCASE'))
+
 class Beatmap(Base):
     __tablename__ = 'beatmaps'
     id = Column(Integer, primary_key=True)
-    beatmapset_id = Column(Integer, ForeignKey('beatmapsets.id'))
+    beatmapset_id = Column(Integer, ForeignKey('beatmapsets.id'), index=True)
     yt_id = Column(String(15))
     artist = Column(String(100))
     title = Column(String(100))
@@ -41,26 +49,42 @@ class Beatmap(Base):
     duration = Column(Integer)
 
     scores = relationship('Score', back_populates='beatmap')
+    best_scores = relationship('BeatmapBestScore', back_populates='beatmap', cascade="all, delete, delete-orphan")
     
     # beatmap file holding all the map's objects, in string form
-    # this should really be in a file, or at least in another table
-    content = deferred(Column(UnicodeText))
+    # the text itself lives in the blob store; see content below
+    content_hash = Column(String(64))
+    content_length = Column(Integer)
 
     beatmapset = relationship('Beatmapset', back_populates='beatmaps')
     kpm = Column(Float)
     base_key_score = Column(Float) # how much score user should get per object
 
+    # bumped whenever what GET /api/beatmaps/<id> returns changes; these make up its ETag
+    version = Column(Integer, default=0)
+    leaderboard_version = Column(Integer, default=0)
+
     def __init__(self, id = None, **kwargs):
         super(Beatmap, self).__init__(**kwargs)
         self.id = id
 
+    @property
+    def content(self):
+        return None if self.content_hash is None else get_blob(self.content_hash).decode()
+
+    @content.setter
+    def content(self, content):
+        self.content_hash, self.content_length = put_text_blob(content)
+
 class Beatmapset(Base):
     __tablename__ = 'beatmapsets'
     id = Column(Integer, primary_key=True)
-    owner_id = Column(String(69), ForeignKey('users.id'))
+    owner_id = Column(String(69), ForeignKey('users.id'), index=True)
     name = Column(String(60))
     description = Column(String(140))
     icon_url = Column(String(100))
+    # bumped whenever the set, its owner's name or any of its diffs change
+    version = Column(Integer, default=0)
 
     owner = relationship('User', back_populates='beatmapsets')
     beatmaps = relationship('Beatmap', back_populates='beatmapset', cascade="all, delete, delete-orphan")
@@ -68,7 +92,7 @@ class Beatmapset(Base):
 class Score(Base):
     __tablename__ = 'scores'
     id = Column(Integer, primary_key=True)
-    user_id = Column(String(69), ForeignKey('users.id'))
+    user_id = Column(String(69), ForeignKey('users.id'), index=True)
     beatmap_id = Column(Integer, ForeignKey('beatmaps.id'))
 
     score = Column(Integer)
@@ -77,11 +101,20 @@ class Score(Base):
     time_unix = Column(Integer)
     speed_modification = Column(Float)
     mod_flag = Column(Integer)
+    # whether the replay reproduces score/accuracies; None if not checked (yet)
+    replay_verified = Column(Boolean)
+    # set when it came in through the ingest queue, so a retried ticket isn't saved twice
+    ticket_id = Column(String(32), index=True, unique=True)
 
     user = relationship('User', back_populates='scores')
     beatmap = relationship('Beatmap', back_populates='scores')
     replay = relationship('Replay', back_populates='score')
 
+    __table_args__ = (
+        # covers per-user best score lookups on a map and rebuild_best_scores
+        Index('ix_scores_beatmap_id_user_id_score', 'beatmap_id', 'user_id', 'score'),
+    )
+
     def __init__(self, id = None, **kwargs):
         super(Score, self).__init__(**kwargs)
         self.id = id
@@ -89,12 +122,117 @@ class Score(Base):
 class Replay(Base):
     __tablename__ = 'replays'
     id = Column(Integer, primary_key=True)
-    score_id = Column(String(69), ForeignKey('scores.id'))
+    score_id = Column(String(69), ForeignKey('scores.id'), index=True)
     score = relationship('Score', back_populates='replay')
     
     # replay data; it's about the size of a beatmap's content
-    # this should be stored on the filesystem but whatever for now
-    data = deferred(Column(UnicodeText))
+    # stored in the blob store as "enuTyping replay format v2" (see replayutils.py),
+    # read and written as v1 text through data
+    data_hash = Column(String(64))
+    data_length = Column(Integer)
+
+    @property
+    def encoded_data(self):
+        return None if self.data_hash is None else get_blob(self.data_hash)
+
+    @encoded_data.setter
+    def encoded_data(self, encoded):
+        if encoded is None:
+            self.data_hash = self.data_length = None
+        else:
+            self.data_hash, self.data_length = put_blob(encoded), len(encoded)
+
+    @property
+    def data(self):
+        return None if self.encoded_data is None else decode_replay(self.encoded_data)
+
+    @data.setter
+    def data(self, replay):
+        self.encoded_data = None if replay is None else encode_replay(replay)
+
+class BeatmapBestScore(Base):
+    # one row per (beatmap, user) pointing at that user's best score
+    # kept up to date by new_score so leaderboards don't aggregate over all scores
+    __tablename__ = 'beatmap_best_scores'
+    beatmap_id = Column(Integer, ForeignKey('beatmaps.id'), primary_key=True)
+    user_id = Column(String(69), ForeignKey('users.id'), primary_key=True)
+    score_id = Column(Integer, ForeignKey('scores.id'))
+    score = Column(Integer)
+    # how many scores the user has on the map, for their most played maps
+    play_count = Column(Integer, default=0)
+
+    beatmap = relationship('Beatmap', back_populates='best_scores')
+    best = relationship('Score')
+
+    __table_args__ = (
+        Index('ix_beatmap_best_scores_beatmap_id_score', 'beatmap_id', 'score'),
+        # a user's bests, for rebuilding their profile
+        Index('ix_beatmap_best_scores_user_id', 'user_id'),
+    )
+
+class UserProfile(Base):
+    # what GET /api/users/<id> shows besides recent scores, kept up to date by new_score; see profiles.py
+    __tablename__ = 'user_profiles'
+    user_id = Column(String(69), ForeignKey('users.id'), primary_key=True)
+    summary = Column(JSON)
+
+def put_text_blob(text):
+    '''
+    returns (hash, length) for storing text in the blob store, (None, None) for None
+    '''
+    if text is None:
+        return None, None
+    data = text.encode()
+    return put_blob(data), len(data)
+
+def referenced_blob_hashes():
+    from database import db_session
+
+    hashes = set()
+    hashes.update(h for h, in db_session.query(Beatmap.content_hash).filter(Beatmap.content_hash.isnot(None)))
+    hashes.update(h for h, in db_session.query(Replay.data_hash).filter(Replay.data_hash.isnot(None)))
+    return hashes
+
+def rebuild_best_scores():
+    '''
+    recompute beatmap_best_scores from scratch out of the scores table
+    earliest score wins ties, same as new_score
+    '''
+    from database import db_session
+
+    partition = (Score.beatmap_id, Score.user_id)
+    ranked = select(Score.beatmap_id, Score.user_id, Score.id, Score.score,
+        func.row_number().over(
+            partition_by=partition,
+            order_by=(Score.score.desc(), Score.id),
+        ).label('rank'),
+        func.count().over(partition_by=partition).label('play_count')) \
+        .where(Score.beatmap_id.isnot(None), Score.user_id.isnot(None)) \
+        .subquery()
+    best = select(ranked.c.beatmap_id, ranked.c.user_id, ranked.c.id, ranked.c.score, ranked.c.play_count) \
+        .where(ranked.c.rank == 1)
+
+    db_session.query(BeatmapBestScore).delete()
+    db_session.execute(insert(BeatmapBestScore.__table__) \
+        .from_select(['beatmap_id', 'user_id', 'score_id', 'score', 'play_count'], best))
+    db_session.commit()
+
+def rebuild_user_stats():
+    '''
+    recompute every user's score sums and play count from the scores table
+    '''
+    from database import db_session
+
+    def total(column):
+        return select(func.coalesce(func.sum(column), 0)).where(Score.user_id == User.id).scalar_subquery()
+
+    db_session.query(User).update({
+        User.key_accuracy_sum: total(Score.key_accuracy),
+        User.kana_accuracy_sum: total(Score.kana_accuracy),
+        User.total_score: total(Score.score),
+        User.play_count: select(func.count(Score.id)).where(Score.user_id == User.id).scalar_subquery(),
+    }, synchronize_session=False)
+    db_session.commit()
 
 def init_db():
     from database import db_session, engine
@@ -227,6 +365,18 @@ def init_db():
 
     db_session.bulk_save_objects(objects)
     db_session.commit()
+    rebuild_best_scores()
+    rebuild_user_stats()
+    from profiles import rebuild_profiles
+    rebuild_profiles(db_session)
+    db_session.commit()
+
+    # bulk saves skip the mapper events that keep the search index up to date
+    from search import rebuild_search_index
+    from user_search import rebuild_user_search_index
+    with engine.begin() as connection:
+        rebuild_search_index(connection)
+        rebuild_user_search_index(connection)
 
 my_time_content = '''ishpytoing file format v1
 
@@ -1625,4 +1775,8 @@ E,113380
 '''
 
 if __name__ == '__main__':
+    # init_db imports search.py and friends, which import this file as models; run as a script it's __main__,
+    # so point models at it rather than loading it a second time and defining every table again
+    import sys
+    sys.modules['models'] = sys.modules[__name__]
     init_db()
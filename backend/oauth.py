@@ -1,11 +1,20 @@
-from flask import Blueprint, redirect, request, session
+from collections import deque
+from flask import Blueprint, abort, redirect, request, session
+from functools import partial
 import os 
 import requests
+from requests.adapters import HTTPAdapter
 import random
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
+from urllib3.util.retry import Retry
+
+from sqlalchemy.exc import IntegrityError
 
 from models import User
-from schemas import UserSchema
+from schemas import dump_user
 from database import db_session
+from writer import run_write
 
 # Github OAuth
 GITHUB_OAUTH_CLIENT_ID = os.environ.get('GITHUB_OAUTH_CLIENT_ID')
@@ -34,6 +43,55 @@ GOOGLE_API_URL = 'https://www.googleapis.com/userinfo/v2/me'
 
 OAUTH_SECRET_KEY = os.environ.get("FLASK_SECRET_KEY", "supersekritsfasdfsaflksjfajlksjfsk")
 
+# provider calls hold up a worker, so they're bounded: seconds to connect, then seconds between bytes
+OAUTH_CONNECT_TIMEOUT = float(os.environ.get('OAUTH_CONNECT_TIMEOUT', 3))
+OAUTH_READ_TIMEOUT = float(os.environ.get('OAUTH_READ_TIMEOUT', 10))
+# retried on connection errors, and on 502/503/504 for GETs; the token POST is never resent once it got there,
+# since codes are single use
+OAUTH_RETRIES = int(os.environ.get('OAUTH_RETRIES', 2))
+OAUTH_POOL_SIZE = int(os.environ.get('OAUTH_POOL_SIZE', 10)) # keep-alive connections per provider
+# request threads (see gunicorn.conf.py) that logins through one provider may hold at once, per worker
+# past that authorize answers 503 with Retry-After straight away (the frontend waits and retries),
+# so a slow provider can't take every thread from gameplay; half of gunicorn's default 8 threads
+LOGIN_CONCURRENCY = int(os.environ.get('LOGIN_CONCURRENCY', 4))
+
+# GET /api/login/<provider>/metrics is for operators too, off (404) unless STATS_ENDPOINTS=1, like GET /api/cache
+STATS_ENDPOINTS = os.environ.get('STATS_ENDPOINTS') == '1'
+
+NAME_ATTEMPTS = 3 # batches of candidates tried before giving up on a new user's name
+
+def make_http_session():
+    retry = Retry(total=OAUTH_RETRIES, backoff_factor=0.2, status_forcelist=(502, 503, 504), raise_on_status=False)
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OAUTH_POOL_SIZE, max_retries=retry)
+    http.mount('https://', adapter)
+    http.mount('http://', adapter)
+    return http
+
+class ProviderMetrics:
+    '''
+    latency of the calls made to one provider, in this worker
+    '''
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=1000) # s, most recent calls
+        self.lock = Lock()
+
+    def record(self, seconds, failed):
+        with self.lock:
+            self.requests += 1
+            self.failures += failed
+            self.latencies.append(seconds)
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1) if latencies else None
+        return { 'requests': self.requests, 'failures': self.failures,
+                 'p50_ms': percentile(0.5), 'p99_ms': percentile(0.99), 'max_ms': percentile(1) }
+
 class OAuth():
     def __init__(self, client_id, client_secret, secret_key, auth_url, token_url, redirect_uri, api_url, scope):
         self.client_id = client_id
@@ -44,6 +102,24 @@ class OAuth():
         self.redirect_uri = redirect_uri
         self.api_url = api_url
         self.scope = scope
+        self.http = make_http_session()
+        self.metrics = ProviderMetrics()
+        self.login_slots = BoundedSemaphore(LOGIN_CONCURRENCY)
+
+    def call(self, method, url, **kwargs):
+        '''
+        one call to the provider through its pooled session; raises requests.RequestException if it fails
+        '''
+        start = perf_counter()
+        failed = True
+        try:
+            res = self.http.request(method, url, timeout=(OAUTH_CONNECT_TIMEOUT, OAUTH_READ_TIMEOUT), **kwargs)
+            res.raise_for_status()
+            data = res.json()
+            failed = False
+            return data
+        finally:
+            self.metrics.record(perf_counter() - start, failed)
 
     def request_url(self):
         params = {
@@ -67,8 +143,7 @@ class OAuth():
         headers = {
             'Accept': 'application/json'
         }
-        res = requests.post(self.token_url, headers = headers, data = data)
-        return res.json()
+        return self.call('POST', self.token_url, headers = headers, data = data)
 
 def construct_oauth_blueprint(provider, oauth, get_user_func):
     bp = Blueprint(provider, __name__)
@@ -87,57 +162,94 @@ def construct_oauth_blueprint(provider, oauth, get_user_func):
             return "No input!", 400
         state = req_json.get('state')
         if state == oauth.secret_key:
-            def get_or_create_user(id, name, avatar_url):
-                user = User.query.get(id)
-                if user:
-                    return user
-                user = User(id, name, avatar_url)
-                db_session.add(user)
-                db_session.commit()
-                return user
-
             code = req_json.get('code')
-            auth_response = oauth.authorize(code)
-            access_token = auth_response['access_token']
-            user_res = get_user_func(oauth, access_token)
+            if not oauth.login_slots.acquire(blocking=False):
+                return "Too many logins in progress, try again shortly", 503, { 'Retry-After': '1' }
+            try:
+                auth_response = oauth.authorize(code)
+                access_token = auth_response.get('access_token')
+                if not access_token:
+                    return "Authorization failed", 400
+                user_res = get_user_func(oauth, access_token)
+            except requests.RequestException:
+                return "Login provider unavailable", 502
+            finally:
+                oauth.login_slots.release()
 
-            user = get_or_create_user(user_res['uid'], user_res['name'], user_res['avatar_url'])
-            user_object = UserSchema().dump(user)
+            user_object = run_write(partial(get_or_create_user, user_res['uid'], user_res['name'], user_res['avatar_url']))
+            if user_object is None:
+                return "Could not find a free name", 409
             session['user'] = user_object
             return user_object
         else:
             return redirect('/api/unauthorized/')
 
+    @bp.route('/metrics', methods = ['GET'])
+    def metrics():
+        if not STATS_ENDPOINTS:
+            abort(404)
+        # this worker's calls only
+        return oauth.metrics.stats()
+
     return bp
 
+def get_or_create_user(id, og_name, avatar_url):
+    '''
+    writer unit for logins: the dumped user, created with a free name based on og_name if it's new
+    None if no free name turned up
+    '''
+    user = User.query.get(id)
+    if user:
+        return dump_user(user)
+    for _ in range(NAME_ATTEMPTS):
+        name = generate_name(og_name)
+        if name is None:
+            continue
+        try:
+            # the unique index on users.name has the last word; taken since the check just means the next batch
+            with db_session.begin_nested():
+                user = User(id, name, avatar_url)
+                db_session.add(user)
+        except IntegrityError:
+            continue
+        return dump_user(user)
+    return None
+
+def name_candidates(og_name):
+    '''
+    og_name, then og_name with 3 random digits, then with 6, so even "user" is settled by one batch
+    '''
+    return [og_name] + [f'{og_name}{n:03}' for n in random.sample(range(1000), 12)] \
+                     + [f'{og_name}{n:06}' for n in random.sample(range(1000000), 7)]
+
+def taken_names_query(names):
+    return db_session.query(User.name).filter(User.name.in_(names))
+
 def generate_name(og_name):
-    name = og_name
-    while True:
-        user = User.query.get(name)
-        if not user:
-            return name
-        name = f'{og_name}{random.randrange(0, 1000):03}'
+    '''
+    the first of name_candidates that nobody has, in one IN query on users.name; None if they're all taken
+    '''
+    candidates = name_candidates(og_name)
+    taken = { name for name, in taken_names_query(candidates) }
+    return next((name for name in candidates if name not in taken), None)
 
 def github_user_func(oauth, token):
-    api_response = requests.get(oauth.api_url, headers = { 'Authorization': f'token {token}' })
-    user = api_response.json()
-    name = generate_name(user['login'])
+    user = oauth.call('GET', oauth.api_url, headers = { 'Authorization': f'token {token}' })
+    name = user['login']
     uid = str(user['id']) + 'github'
     avatar_url = user['avatar_url']
     return { 'name': name, 'uid': uid, 'avatar_url': avatar_url }
 
 def osu_user_func(oauth, token):
-    api_response = requests.get(oauth.api_url, headers = { 'Authorization': f'Bearer {token}' })
-    user = api_response.json()
-    name = generate_name(user['username'])
+    user = oauth.call('GET', oauth.api_url, headers = { 'Authorization': f'Bearer {token}' })
+    name = user['username']
     uid = str(user['id']) + 'osu'
     avatar_url = user['avatar_url']
     return { 'name': name, 'uid': uid, 'avatar_url': avatar_url }
 
 def google_user_func(oauth, token):
-    api_response = requests.get(oauth.api_url, headers = { 'Authorization': f'Bearer {token}' })
-    user = api_response.json()
-    name = generate_name(user['given_name'])
+    user = oauth.call('GET', oauth.api_url, headers = { 'Authorization': f'Bearer {token}' })
+    name = user['given_name']
     uid = str(user['id']) + 'google'
     avatar_url = user['picture']
     return { 'name': name, 'uid': uid, 'avatar_url': avatar_url }
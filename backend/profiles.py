@@ -0,0 +1,98 @@
+'''
+the profile summary GET /api/users/<id> shows next to recent scores, stored per user in user_profiles
+so a profile page is one indexed read however many scores the user has
+    top_plays: the user's best score on each map, for their TOP_PLAYS highest ones
+    grade_counts: grade of their best score on each map, counted
+    most_played: the MOST_PLAYED maps they've submitted the most scores on, from beatmap_best_scores.play_count
+
+a new score only changes its own map's entries, so save_score updates the summary in place (update_profile);
+deleting maps takes best scores away, so the users who had them are rebuilt from beatmap_best_scores instead
+'''
+import os
+
+from gameplayutils import GRADES, get_grade
+from models import BeatmapBestScore, Score, UserProfile
+from schemas import dump_scores_without_user
+
+TOP_PLAYS = int(os.environ.get('PROFILE_TOP_PLAYS', 20))
+MOST_PLAYED = int(os.environ.get('PROFILE_MOST_PLAYED', 10))
+
+def grade_of(score):
+    return get_grade(score.score or 0, score.speed_modification or 1, score.mod_flag or 0)
+
+def top_play_key(play):
+    return -play['score'], play['id']
+
+def most_played_key(entry):
+    return -entry['play_count'], entry['beatmap_id']
+
+def build_summary(bests):
+    '''
+    bests is [(best Score, play count)], one per map
+    '''
+    grade_counts = dict.fromkeys(GRADES, 0)
+    for score, _ in bests:
+        grade_counts[grade_of(score)] += 1
+    top = sorted((score for score, _ in bests), key=lambda score: (-score.score, score.id))[:TOP_PLAYS]
+    most_played = sorted(({ 'beatmap_id': score.beatmap_id, 'play_count': play_count } for score, play_count in bests),
+                         key=most_played_key)[:MOST_PLAYED]
+    return { 'top_plays': dump_scores_without_user(top), 'grade_counts': grade_counts, 'most_played': most_played }
+
+def empty_summary():
+    return build_summary([])
+
+def bests_query(session):
+    return session.query(Score, BeatmapBestScore.play_count) \
+        .join(BeatmapBestScore, BeatmapBestScore.score_id == Score.id)
+
+def rebuild_profiles(session, user_ids=None):
+    '''
+    recompute the summaries of user_ids (everyone with a best score if None) from beatmap_best_scores
+    caller commits
+    '''
+    query = bests_query(session)
+    if user_ids is not None:
+        user_ids = set(user_ids)
+        query = query.filter(BeatmapBestScore.user_id.in_(user_ids))
+        session.query(UserProfile).filter(UserProfile.user_id.in_(user_ids)).delete(synchronize_session='fetch')
+    else:
+        session.query(UserProfile).delete(synchronize_session='fetch')
+    bests = {}
+    for score, play_count in query:
+        bests.setdefault(score.user_id, []).append((score, play_count))
+    session.add_all(UserProfile(user_id=user_id, summary=build_summary(user_bests))
+                    for user_id, user_bests in bests.items())
+
+def update_profile(session, score, best, previous_best_id):
+    '''
+    folds a new score into its user's summary; best is their BeatmapBestScore on its map, already updated
+    previous_best_id is the score best pointed at before if score replaced it, score.id if score didn't beat it
+    and None if it's their first score on the map
+    needs score.id, so flush first; caller commits
+    '''
+    profile = session.query(UserProfile).get(score.user_id)
+    if profile is None:
+        profile = UserProfile(user_id=score.user_id, summary=build_summary(
+            bests_query(session).filter(BeatmapBestScore.user_id == score.user_id).all()))
+        session.add(profile)
+        return
+    summary = profile.summary
+
+    most_played = [entry for entry in summary['most_played'] if entry['beatmap_id'] != score.beatmap_id]
+    most_played.append({ 'beatmap_id': score.beatmap_id, 'play_count': best.play_count })
+    most_played = sorted(most_played, key=most_played_key)[:MOST_PLAYED]
+
+    grade_counts = summary['grade_counts']
+    top_plays = summary['top_plays']
+    if previous_best_id != score.id:
+        grade_counts = dict(grade_counts)
+        if previous_best_id is not None:
+            grade_counts[grade_of(session.query(Score).get(previous_best_id))] -= 1
+        grade_counts[grade_of(score)] += 1
+        # other maps' bests are unchanged, so only this map's entry can move
+        top_plays = [play for play in top_plays if play['beatmap_id'] != score.beatmap_id]
+        top_plays.extend(dump_scores_without_user([score]))
+        top_plays = sorted(top_plays, key=top_play_key)[:TOP_PLAYS]
+
+    # a new dict, so the JSON column sees the change
+    profile.summary = { 'top_plays': top_plays, 'grade_counts': grade_counts, 'most_played': most_played }
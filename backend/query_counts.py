@@ -0,0 +1,75 @@
+'''
+query budgets for the GET endpoints in api.py, to catch N+1 regressions from nested schema dumps
+run with `flask check-query-counts`; exits nonzero if any endpoint goes over its budget
+budgets don't depend on how many rows come back, so run it against a database with a few of everything
+'''
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from database import engine, read_engine
+from models import Beatmap, Beatmapset
+
+# the most queries a request may issue, however many rows it returns
+QUERY_BUDGETS = {
+    '/api/users': 1,
+    '/api/users?search=abc': 3,
+    # rankings add one query to catch up on new scores, plus one the first time they're loaded
+    '/api/users/{user}': 4,
+    '/api/rankings': 4,
+    '/api/beatmaps': 1,
+    '/api/beatmaps?search=a': 2,
+    '/api/beatmaps/{beatmap}': 4,
+    '/api/beatmaps/{beatmap}?format=parsed': 4,
+    '/api/beatmapsets': 2,
+    '/api/beatmapsets?search=a': 3,
+    '/api/beatmapsets?owner={user}': 2,
+    '/api/beatmapsets/{beatmapset}': 3,
+}
+
+@contextmanager
+def count_queries():
+    '''
+    with count_queries() as statements: ...
+    statements collects the sql of every query run on the engine inside the block
+    '''
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith('BEGIN'): # see make_engine
+            statements.append(statement)
+    engines = { engine, read_engine }
+    for e in engines:
+        event.listen(e, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for e in engines:
+            event.remove(e, 'before_cursor_execute', before_cursor_execute)
+
+@contextmanager
+def assert_max_queries(n):
+    with count_queries() as statements:
+        yield statements
+    if len(statements) > n:
+        raise AssertionError(f'{len(statements)} queries, expected at most {n}:\n' + '\n'.join(statements))
+
+def find_over_budget(client):
+    '''
+    requests every endpoint in QUERY_BUDGETS with client (a flask test client)
+    returns {url: statements} for the ones that went over
+    '''
+    sample = {
+        'user': Beatmapset.query.first().owner_id,
+        'beatmap': Beatmap.query.first().id,
+        'beatmapset': Beatmapset.query.first().id,
+    }
+    bad = {}
+    for url, budget in QUERY_BUDGETS.items():
+        url = url.format(**sample)
+        with count_queries() as statements:
+            res = client.get(url)
+        if res.status_code != 200:
+            raise RuntimeError(f'{url} returned {res.status_code}')
+        if len(statements) > budget:
+            bad[url] = statements
+    return bad
@@ -0,0 +1,41 @@
+'''
+EXPLAIN QUERY PLAN checks for the hot queries in api.py, oauth.py, user_search.py and profiles.py
+run with `flask check-query-plans`; exits nonzero if any of them scans a table
+'''
+from database import db_session
+from api import leaderboard_query, recent_scores_query, diffs_query, owned_beatmapsets_query, page_query
+from models import Beatmap, Beatmapset, BeatmapBestScore, User
+from oauth import taken_names_query
+from user_search import prefix_query
+from profiles import bests_query
+
+# sample arguments don't matter, only the shape of the query does
+HOT_QUERIES = {
+    'leaderboard': lambda: leaderboard_query(1),
+    'profile recent scores': lambda: recent_scores_query('1'),
+    'diffs of a set': lambda: diffs_query(1),
+    'sets of an owner': lambda: owned_beatmapsets_query('1'),
+    'page of sets': lambda: page_query(Beatmapset.query, Beatmapset.id, 1, 50),
+    'page of sets of an owner': lambda: page_query(owned_beatmapsets_query('1'), Beatmapset.id, 1, 50),
+    'page of maps': lambda: page_query(Beatmap.query, Beatmap.id, 1, 50),
+    'page of users': lambda: page_query(User.query, User.id, '1', 50),
+    'user search prefix': lambda: prefix_query(db_session, 'a', 50),
+    'bests of a user': lambda: bests_query(db_session).filter(BeatmapBestScore.user_id == '1'),
+    'taken names': lambda: taken_names_query(['a', 'a123', 'a123456']),
+}
+
+def explain(query):
+    sql = query.statement.compile(bind=db_session.get_bind(), compile_kwargs={'literal_binds': True})
+    rows = db_session.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()
+    return [row[-1] for row in rows]
+
+def find_scans():
+    '''
+    returns {query name: [plan lines]} for every hot query whose plan has a SCAN
+    '''
+    bad = {}
+    for name, make_query in HOT_QUERIES.items():
+        plan = explain(make_query())
+        if any(line.startswith('SCAN') for line in plan):
+            bad[name] = plan
+    return bad
@@ -0,0 +1,159 @@
+'''
+global ranking by total score, kept in memory as an order-statistic treap (O(log n) update, rank and index)
+built from users.total_score on first use; after that, every new row in scores is applied as a delta,
+since that's exactly how save_score moves total_score. so each gunicorn worker stays in sync with
+everyone else's submissions by reading scores past the last id it has seen
+only users with at least one score are ranked
+'''
+import random
+from threading import Lock
+
+from sqlalchemy import func
+
+from models import Score, User
+
+class Node:
+    __slots__ = ('key', 'priority', 'size', 'left', 'right')
+
+    def __init__(self, key):
+        self.key = key
+        self.priority = random.random()
+        self.size = 1
+        self.left = None
+        self.right = None
+
+def size(node):
+    return node.size if node else 0
+
+def update(node):
+    node.size = 1 + size(node.left) + size(node.right)
+    return node
+
+def split(node, key):
+    '''
+    (keys < key, keys >= key)
+    '''
+    if node is None:
+        return None, None
+    if node.key < key:
+        left, right = split(node.right, key)
+        node.right = left
+        return update(node), right
+    left, right = split(node.left, key)
+    node.left = right
+    return left, update(node)
+
+def merge(left, right):
+    if left is None or right is None:
+        return left or right
+    if left.priority > right.priority:
+        left.right = merge(left.right, right)
+        return update(left)
+    right.left = merge(left, right.left)
+    return update(right)
+
+class OrderStatisticTree:
+    def __init__(self):
+        self.root = None
+
+    def __len__(self):
+        return size(self.root)
+
+    def insert(self, key):
+        left, right = split(self.root, key)
+        self.root = merge(merge(left, Node(key)), right)
+
+    def remove(self, key):
+        left, right = split(self.root, key)
+        _, right = split(right, (key[0], key[1] + '\0')) # drops exactly key
+        self.root = merge(left, right)
+
+    def count_less(self, key):
+        count = 0
+        node = self.root
+        while node:
+            if node.key < key:
+                count += size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return count
+
+    def slice(self, start, n):
+        '''
+        keys at positions start..start+n-1, in order
+        '''
+        out = []
+        def visit(node, offset):
+            # offset: position of node's leftmost key
+            if node is None or len(out) >= n or offset + node.size <= start:
+                return
+            visit(node.left, offset)
+            position = offset + size(node.left)
+            if start <= position and len(out) < n:
+                out.append(node.key)
+            visit(node.right, position + 1)
+        visit(self.root, 0)
+        return out
+
+class Rankings:
+    def __init__(self):
+        self.tree = OrderStatisticTree()
+        self.totals = {} # user id -> total score
+        self.last_score_id = None
+        self.lock = Lock()
+
+    def set_total(self, user_id, total):
+        if user_id in self.totals:
+            self.tree.remove((-self.totals[user_id], user_id))
+        self.totals[user_id] = total
+        self.tree.insert((-total, user_id))
+
+    def refresh(self, session):
+        '''
+        loads everything the first time, then only scores added since the last call
+        '''
+        with self.lock:
+            if self.last_score_id is None:
+                # same transaction, so the totals and the max id are from one snapshot
+                rows = session.query(User.id, User.total_score).filter(User.play_count > 0).all()
+                self.last_score_id = session.query(func.max(Score.id)).scalar() or 0
+                for user_id, total in rows:
+                    self.set_total(user_id, total)
+                return
+            new_scores = session.query(Score.id, Score.user_id, Score.score) \
+                    .filter(Score.id > self.last_score_id).order_by(Score.id).all()
+            for score_id, user_id, score in new_scores:
+                if user_id is not None:
+                    self.set_total(user_id, self.totals.get(user_id, 0) + score)
+                self.last_score_id = score_id
+
+    def rank(self, user_id):
+        '''
+        1 + how many users have a strictly higher total, or None if unranked
+        '''
+        with self.lock:
+            total = self.totals.get(user_id)
+            if total is None:
+                return None
+            return self.tree.count_less((-total, '')) + 1
+
+    def page(self, start, n):
+        '''
+        [(rank, user id, total score)] for positions start..start+n-1, best first
+        '''
+        with self.lock:
+            keys = self.tree.slice(start, n)
+            page = []
+            for i, (negative_total, user_id) in enumerate(keys):
+                if i and keys[i - 1][0] == negative_total:
+                    rank = page[-1][0]
+                else:
+                    rank = self.tree.count_less((negative_total, '')) + 1
+                page.append((rank, user_id, -negative_total))
+            return page
+
+    def __len__(self):
+        return len(self.tree)
+
+rankings = Rankings()
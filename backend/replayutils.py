@@ -0,0 +1,103 @@
+'''
+"enuTyping replay format v2": compact binary storage for replays
+the frontend still sends v1 text (key|@|timestamp per line); Replay.data converts on the way in and out
+
+layout:
+    b'ENU2', flags byte (FLAG_ZLIB: the rest is zlib compressed)
+    varint number of distinct keys, then each key as varint length + utf-8
+    varint number of keystrokes, then per keystroke:
+        varint index into the key list, zigzag varint ms since the previous keystroke
+'''
+import zlib
+
+from gameplayutils import deserialize_replay, serialize_replay
+
+MAGIC = b'ENU2'
+FLAG_ZLIB = 1
+ZLIB_LEVEL = 6
+
+def write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def read_varint(data, pos):
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+def zigzag(n):
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+def unzigzag(n):
+    return n >> 1 if not n & 1 else -(n >> 1) - 1
+
+def encode_key_log(key_log, compress=True):
+    keys = {}
+    for key, _ in key_log:
+        keys.setdefault(key, len(keys))
+    body = bytearray()
+    write_varint(body, len(keys))
+    for key in keys:
+        key_bytes = key.encode()
+        write_varint(body, len(key_bytes))
+        body += key_bytes
+    write_varint(body, len(key_log))
+    last_time = 0
+    for key, timestamp in key_log:
+        write_varint(body, keys[key])
+        write_varint(body, zigzag(timestamp - last_time))
+        last_time = timestamp
+
+    flags = 0
+    body = bytes(body)
+    if compress:
+        compressed = zlib.compress(body, ZLIB_LEVEL)
+        if len(compressed) < len(body):
+            flags |= FLAG_ZLIB
+            body = compressed
+    return MAGIC + bytes([flags]) + body
+
+def decode_key_log(data):
+    flags = data[len(MAGIC)]
+    body = data[len(MAGIC) + 1:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    n_keys, pos = read_varint(body, 0)
+    keys = []
+    for _ in range(n_keys):
+        length, pos = read_varint(body, pos)
+        keys.append(body[pos:pos + length].decode())
+        pos += length
+    n_events, pos = read_varint(body, pos)
+    key_log = []
+    timestamp = 0
+    for _ in range(n_events):
+        index, pos = read_varint(body, pos)
+        delta, pos = read_varint(body, pos)
+        timestamp += unzigzag(delta)
+        key_log.append((keys[index], timestamp))
+    return key_log
+
+def is_v2(data):
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:len(MAGIC)]) == MAGIC
+
+def encode_replay(replay):
+    '''
+    v1 text -> v2 bytes; lines v1 readers would skip are dropped
+    '''
+    return encode_key_log(deserialize_replay(replay))
+
+def decode_replay(data):
+    '''
+    v2 bytes -> v1 text; rows that were never re-encoded come back as they are
+    '''
+    if not is_v2(data):
+        return data.decode() if isinstance(data, (bytes, bytearray)) else data
+    return serialize_replay(decode_key_log(bytes(data)))
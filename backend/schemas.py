@@ -1,9 +1,21 @@
-from marshmallow import Schema, fields
+from marshmallow import Schema, ValidationError, fields, post_load, validates
+
+from kana import DEFAULT_CONFIG, KANA_RESPELLINGS
+from replayutils import encode_replay
+from serializers import compile_dump
+
+def average(total_field):
+    # 1 until there's something to average, like before any scores
+    # (or if the sum is NULL, which flask rebuild-user-stats fixes)
+    def get(user):
+        total = getattr(user, total_field)
+        return total / user.play_count if user.play_count and total is not None else 1
+    return get
 
 class UserStats(Schema):
     join_time = fields.Int()
-    key_accuracy = fields.Float()
-    kana_accuracy = fields.Float()
+    key_accuracy = fields.Function(average('key_accuracy_sum'))
+    kana_accuracy = fields.Function(average('kana_accuracy_sum'))
     total_score = fields.Int()
     play_count = fields.Int()
 
@@ -19,9 +31,10 @@ user_stats_schema = UserStats()
 class ScoreSchema(Schema):
     id = fields.Int(dump_only=True)
     beatmap_id = fields.Int()
-    score = fields.Int()
-    key_accuracy = fields.Float()
-    kana_accuracy = fields.Float()
+    # save_score adds these to the user's sums, so a score without them can't be saved
+    score = fields.Int(required=True)
+    key_accuracy = fields.Float(required=True)
+    kana_accuracy = fields.Float(required=True)
     user_id = fields.Str(load_only=True)
     user = fields.Nested(UserSchema(only=("id", "name", "avatar_url")), dump_only=True)
     time_unix = fields.Int()
@@ -40,6 +53,44 @@ class ReplaySchema(Schema):
 
 replay_schema = ReplaySchema()
 
+class GameplayConfigSchema(Schema):
+    '''
+    the settings that change which keystrokes count, as GameArea sends them with a score
+    loads to the config gameplayutils.simulate_replay takes
+    '''
+    type_polygraphs = fields.Bool(required=True)
+    kana_spellings = fields.Dict(keys=fields.Str(), values=fields.Str(), required=True)
+
+    @validates('kana_spellings')
+    def validate_kana_spellings(self, kana_spellings):
+        # only the choices Settings offers
+        for kana, spelling in kana_spellings.items():
+            if spelling not in KANA_RESPELLINGS.get(kana, ()):
+                raise ValidationError(f'Invalid spelling for {kana}: {spelling}')
+
+    @post_load
+    def fill_spellings(self, data, **kwargs):
+        data['kana_spellings'] = { **DEFAULT_CONFIG['kana_spellings'], **data['kana_spellings'] }
+        return data
+
+gameplay_config_schema = GameplayConfigSchema()
+
+def validate_replay_data(replay_data):
+    # Replay.data stores it v2 encoded (see replayutils.py), so it has to survive that
+    try:
+        encode_replay(replay_data)
+    except ValueError:
+        raise ValidationError('Not a valid replay.')
+
+class NewScoreSchema(ScoreSchema):
+    '''
+    a POST /api/scores body: a score plus what verification.py checks it with
+    '''
+    replay_data = fields.Str(allow_none=True, load_default=None, load_only=True, validate=validate_replay_data)
+    gameplay_config = fields.Nested(GameplayConfigSchema, allow_none=True, load_default=None, load_only=True)
+
+new_score_schema = NewScoreSchema()
+
 # TODO: probably a lot of these schemas are required=True, but w/e
 
 class BeatmapSchema(Schema):
@@ -72,3 +123,15 @@ class BeatmapsetSchema(Schema):
 
 beatmapset_schema = BeatmapsetSchema()
 beatmapsets_schema = BeatmapsetSchema(many=True)
+
+# same output as .dump, generated once per schema (see serializers.py); api.py dumps with these
+dump_user = compile_dump(user_schema)
+dump_users = compile_dump(users_schema)
+dump_user_stats = compile_dump(user_stats_schema)
+dump_score = compile_dump(score_schema)
+dump_scores = compile_dump(scores_schema)
+dump_scores_without_user = compile_dump(scores_without_user_schema)
+dump_beatmap = compile_dump(beatmap_schema)
+dump_beatmaps = compile_dump(beatmaps_schema)
+dump_beatmapset = compile_dump(beatmapset_schema)
+dump_beatmapsets = compile_dump(beatmapsets_schema)
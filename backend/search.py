@@ -0,0 +1,119 @@
+'''
+full-text search over beatmaps and beatmapsets (SQLite FTS5)
+beatmap_search has a row per beatmap, beatmapset_search a row per set with its diffs' metadata folded in
+both are kept in sync by the mapper events below, so every ORM write path is covered
+
+unicode61 would treat a run of Japanese as one token, so CJK text is indexed one character per token
+and queried as a phrase; that gives substring matches for Japanese and word prefix matches for romaji
+'''
+import re
+
+from sqlalchemy import event, text
+
+from models import Beatmap, Beatmapset
+
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 200
+
+BEATMAP_COLUMNS = ['artist', 'title', 'artist_original', 'title_original', 'diffname']
+BEATMAPSET_COLUMNS = ['name', 'description'] + BEATMAP_COLUMNS
+# bm25 weights, in column order
+BEATMAP_WEIGHTS = [5, 10, 5, 10, 2]
+BEATMAPSET_WEIGHTS = [10, 1, 5, 10, 5, 10, 2]
+
+CJK = re.compile('([぀-ヿ㐀-䶿一-鿿豈-﫿ｦ-ﾟ])')
+
+def segment(s):
+    return CJK.sub(r' \1 ', s or '')
+
+def to_match_query(search_query):
+    '''
+    every whitespace separated term has to match, the last token of each as a prefix
+    returns None if there's nothing to search for
+    '''
+    terms = []
+    for term in search_query.split():
+        tokens = segment(term).split()
+        if tokens:
+            phrase = ' '.join(tokens).replace('"', '""')
+            terms.append(f'"{phrase}"*')
+    return ' '.join(terms) or None
+
+def create_search_tables(connection):
+    for table, columns in [('beatmap_search', BEATMAP_COLUMNS), ('beatmapset_search', BEATMAPSET_COLUMNS)]:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5({', '.join(columns)}, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"))
+
+def drop_search_tables(connection):
+    connection.execute(text('DROP TABLE IF EXISTS beatmap_search'))
+    connection.execute(text('DROP TABLE IF EXISTS beatmapset_search'))
+
+def index_beatmap(connection, beatmap_id):
+    connection.execute(text('DELETE FROM beatmap_search WHERE rowid = :id'), { 'id': beatmap_id })
+    row = connection.execute(text(f"SELECT {', '.join(BEATMAP_COLUMNS)} FROM beatmaps WHERE id = :id"),
+                             { 'id': beatmap_id }).fetchone()
+    if row is None:
+        return
+    connection.execute(text(
+        f"INSERT INTO beatmap_search (rowid, {', '.join(BEATMAP_COLUMNS)}) "
+        f"VALUES (:id, {', '.join(':' + c for c in BEATMAP_COLUMNS)})"),
+        { 'id': beatmap_id, **{ c: segment(v) for c, v in zip(BEATMAP_COLUMNS, row) } })
+
+def index_beatmapset(connection, beatmapset_id):
+    connection.execute(text('DELETE FROM beatmapset_search WHERE rowid = :id'), { 'id': beatmapset_id })
+    row = connection.execute(text('SELECT name, description FROM beatmapsets WHERE id = :id'),
+                             { 'id': beatmapset_id }).fetchone()
+    if row is None:
+        return
+    diffs = connection.execute(text(f"SELECT {', '.join(BEATMAP_COLUMNS)} FROM beatmaps WHERE beatmapset_id = :id"),
+                               { 'id': beatmapset_id }).fetchall()
+    values = { 'name': segment(row[0]), 'description': segment(row[1]) }
+    for i, column in enumerate(BEATMAP_COLUMNS):
+        values[column] = ' '.join(segment(diff[i]) for diff in diffs)
+    connection.execute(text(
+        f"INSERT INTO beatmapset_search (rowid, {', '.join(BEATMAPSET_COLUMNS)}) "
+        f"VALUES (:id, {', '.join(':' + c for c in BEATMAPSET_COLUMNS)})"),
+        { 'id': beatmapset_id, **values })
+
+def rebuild_search_index(connection):
+    create_search_tables(connection)
+    connection.execute(text('DELETE FROM beatmap_search'))
+    connection.execute(text('DELETE FROM beatmapset_search'))
+    for beatmap_id, in connection.execute(text('SELECT id FROM beatmaps')).fetchall():
+        index_beatmap(connection, beatmap_id)
+    for beatmapset_id, in connection.execute(text('SELECT id FROM beatmapsets')).fetchall():
+        index_beatmapset(connection, beatmapset_id)
+
+@event.listens_for(Beatmap, 'after_insert')
+@event.listens_for(Beatmap, 'after_update')
+@event.listens_for(Beatmap, 'after_delete')
+def on_beatmap_change(mapper, connection, beatmap):
+    index_beatmap(connection, beatmap.id)
+    if beatmap.beatmapset_id is not None:
+        index_beatmapset(connection, beatmap.beatmapset_id)
+
+@event.listens_for(Beatmapset, 'after_insert')
+@event.listens_for(Beatmapset, 'after_update')
+@event.listens_for(Beatmapset, 'after_delete')
+def on_beatmapset_change(mapper, connection, beatmapset):
+    index_beatmapset(connection, beatmapset.id)
+
+def search_ids(session, table, weights, search_query, limit):
+    '''
+    ids matching search_query, best first, or None if the query has no searchable terms
+    '''
+    match_query = to_match_query(search_query)
+    if match_query is None:
+        return None
+    rows = session.execute(text(
+        f"SELECT rowid FROM {table} WHERE {table} MATCH :query "
+        f"ORDER BY bm25({table}, {', '.join(map(str, weights))}) LIMIT :limit"),
+        { 'query': match_query, 'limit': limit })
+    return [id for id, in rows]
+
+def search_beatmaps(session, search_query, limit=DEFAULT_SEARCH_LIMIT):
+    return search_ids(session, 'beatmap_search', BEATMAP_WEIGHTS, search_query, limit)
+
+def search_beatmapsets(session, search_query, limit=DEFAULT_SEARCH_LIMIT):
+    return search_ids(session, 'beatmapset_search', BEATMAPSET_WEIGHTS, search_query, limit)
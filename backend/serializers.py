@@ -0,0 +1,65 @@
+'''
+marshmallow's dump looks up and calls every field's serialize for every object, which is most of the time spent
+dumping a 50 score leaderboard or a long mapset list
+compile_dump turns a schema into one generated function with the same output
+only the field types schemas.py uses are supported, and anything else fails at import rather than per request
+objects need every attribute the schema dumps (model instances always do); marshmallow would leave missing ones out
+'''
+from marshmallow import fields
+from marshmallow.utils import ensure_text_type, get_func_args
+
+# expression for a field's value v, as marshmallow's _serialize would give it; same type is skipped, like int(int)
+CONVERSIONS = {
+    fields.Integer: 'None if v is None else v if v.__class__ is int else int(v)',
+    fields.Float: 'None if v is None else v if v.__class__ is float else float(v)',
+    fields.String: 'None if v is None else v if v.__class__ is str else ensure_text_type(v)',
+}
+
+def compile_dump(schema):
+    '''
+    returns dump(obj), or dump(objs) -> list for a many schema, equal to schema.dump
+    '''
+    dump_one = compile_one(schema)
+    if not schema.many:
+        return dump_one
+    def dump(objs):
+        return [dump_one(obj) for obj in objs]
+    return dump
+
+def compile_one(schema):
+    '''
+    the generated function for one object, whether or not schema is many
+    '''
+    if any(schema._hooks[hook] for hook in schema._hooks if hook[0] in ('pre_dump', 'post_dump')):
+        raise ValueError(f'{type(schema).__name__} has dump hooks, which compile_dump does not run')
+    namespace = { 'ensure_text_type': ensure_text_type }
+    lines = ['def dump_one(obj):']
+    items = []
+    for i, (name, field) in enumerate(schema.dump_fields.items()):
+        key = field.data_key if field.data_key is not None else name
+        attribute = field.attribute or name
+        if type(field) in CONVERSIONS and getattr(field, 'as_string', False) is False:
+            lines.append(f'    v = obj.{attribute}')
+            lines.append(f'    value{i} = {CONVERSIONS[type(field)]}')
+        elif type(field) is fields.Function and len(get_func_args(field.serialize_func)) == 1:
+            namespace[f'function{i}'] = field.serialize_func
+            lines.append(f'    value{i} = function{i}(obj)')
+        elif type(field) is fields.Nested and not callable(field.nested):
+            nested = field.schema
+            many = nested.many or field.many
+            namespace[f'nested{i}'] = compile_one(nested)
+            lines.append(f'    v = obj.{attribute}')
+            if many:
+                lines.append(f'    value{i} = None if v is None else [nested{i}(o) for o in v]')
+            else:
+                # one schema over a list (BeatmapSchema.scores): every field misses, like it does in marshmallow
+                namespace[f'schema{i}'] = nested
+                list_result = '{}' if all(type(f) is not fields.Function for f in nested.dump_fields.values()) \
+                              else f'schema{i}.dump(v)'
+                lines.append(f'    value{i} = None if v is None else {list_result} if isinstance(v, list) else nested{i}(v)')
+        else:
+            raise ValueError(f'compile_dump does not support {type(field).__name__} ({type(schema).__name__}.{name})')
+        items.append(f'{key!r}: value{i}')
+    lines.append(f'    return {{ {", ".join(items)} }}')
+    exec('\n'.join(lines), namespace)
+    return namespace['dump_one']
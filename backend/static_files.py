@@ -0,0 +1,80 @@
+'''
+serves the built frontend (frontend/build) from memory
+the first request reads every file once, with its ETag and gzip/brotli variants compressed at the highest level;
+nothing is read or compressed per request after that, and .gz/.br files already next to a file are used as is
+files with a content hash in their name (bundle.<hash>.js, webpack's asset names) never change,
+so they're sent with Cache-Control: immutable; anything else, like index.html, is revalidated with its ETag
+'''
+from functools import lru_cache
+from hashlib import sha1
+import mimetypes
+import os
+import re
+
+from flask import Response, abort, request
+
+from compression import ENCODINGS, COMPRESSION_MIN_SIZE, accepted_encoding, compress
+
+FRONTEND_BUILD_DIR = os.environ.get('FRONTEND_BUILD_DIR', os.path.join(os.path.dirname(__file__), '../frontend/build'))
+HASHED_NAME = re.compile(r'(^|[.-])[0-9a-f]{16,}\.') # webpack's [contenthash] is 20 hex digits by default
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'image/x-icon',
+                'image/vnd.microsoft.icon')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+PRECOMPRESSED = { 'gzip': '.gz', 'br': '.br' }
+MAX_LEVEL = { 'gzip': 9, 'br': 11 }
+
+class StaticFile:
+    __slots__ = ('data', 'mimetype', 'etag', 'cache_control', 'variants')
+
+    def __init__(self, path, name):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.etag = sha1(self.data).hexdigest()
+        self.cache_control = IMMUTABLE if HASHED_NAME.search(os.path.basename(name)) else 'no-cache'
+        self.variants = {} # encoding -> compressed data
+        if len(self.data) < COMPRESSION_MIN_SIZE or not self.mimetype.startswith(COMPRESSIBLE):
+            return
+        for encoding in ENCODINGS:
+            if os.path.exists(path + PRECOMPRESSED[encoding]):
+                with open(path + PRECOMPRESSED[encoding], 'rb') as f:
+                    compressed = f.read()
+            else:
+                compressed = compress(self.data, encoding, MAX_LEVEL[encoding])
+            if len(compressed) < len(self.data):
+                self.variants[encoding] = compressed
+
+@lru_cache(maxsize=None)
+def build_files(directory=FRONTEND_BUILD_DIR):
+    '''
+    {path relative to directory: StaticFile}
+    '''
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith(tuple(PRECOMPRESSED.values())):
+                continue
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, directory).replace(os.sep, '/')
+            files[relative] = StaticFile(path, relative)
+    return files
+
+def send_build_file(filename):
+    file = build_files().get(filename)
+    if file is None:
+        abort(404)
+    if request.if_none_match.contains_weak(file.etag):
+        res = Response(status=304)
+    else:
+        encoding = accepted_encoding(file.variants)
+        if encoding is not None:
+            res = Response(file.variants[encoding], mimetype=file.mimetype)
+            res.headers['Content-Encoding'] = encoding
+        else:
+            res = Response(file.data, mimetype=file.mimetype)
+    # weak whether or not it's encoded, so a 304 can answer for every representation
+    res.set_etag(file.etag, weak=True)
+    res.headers['Cache-Control'] = file.cache_control
+    if file.variants:
+        res.vary.add('Accept-Encoding')
+    return res
@@ -0,0 +1,102 @@
+'''
+search over user names, ranked exact match, then prefix, then infix
+exact and prefix matches are a range on ix_users_name_nocase; in that order an exact match sorts before
+every longer name it's a prefix of, so both come from one query
+infix matches come from user_search, an FTS5 trigram index, so any substring of 3 or more characters is
+an index lookup; shorter queries only get exact and prefix matches
+users are keyed by a string id and FTS5 rows by an integer rowid, so user_search_keys hands out the rowids
+
+both tables are kept in sync by the mapper events below, so user creation in oauth.py and change_name
+are covered like every other ORM write
+'''
+from sqlalchemy import event, inspect, text
+
+from database import Base
+from models import User
+from search import DEFAULT_SEARCH_LIMIT
+
+TRIGRAM = 3
+
+def escape_like(s):
+    return s.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def create_user_search_tables(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS user_search_keys '
+        '(rowid INTEGER PRIMARY KEY, user_id VARCHAR(69) NOT NULL UNIQUE)'))
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(name, tokenize='trigram')"))
+
+def drop_user_search_tables(connection):
+    connection.execute(text('DROP TABLE IF EXISTS user_search'))
+    connection.execute(text('DROP TABLE IF EXISTS user_search_keys'))
+
+def index_user(connection, user_id):
+    key = connection.execute(text('SELECT rowid FROM user_search_keys WHERE user_id = :id'),
+                             { 'id': user_id }).scalar()
+    if key is not None:
+        connection.execute(text('DELETE FROM user_search WHERE rowid = :key'), { 'key': key })
+    row = connection.execute(text('SELECT name FROM users WHERE id = :id'), { 'id': user_id }).fetchone()
+    if row is None:
+        connection.execute(text('DELETE FROM user_search_keys WHERE user_id = :id'), { 'id': user_id })
+        return
+    if key is None:
+        key = connection.execute(text('INSERT INTO user_search_keys (user_id) VALUES (:id)'),
+                                 { 'id': user_id }).lastrowid
+    connection.execute(text('INSERT INTO user_search (rowid, name) VALUES (:key, :name)'),
+                       { 'key': key, 'name': row[0] or '' })
+
+def rebuild_user_search_index(connection):
+    create_user_search_tables(connection)
+    connection.execute(text('DELETE FROM user_search'))
+    connection.execute(text('DELETE FROM user_search_keys'))
+    connection.execute(text('INSERT INTO user_search_keys (user_id) SELECT id FROM users ORDER BY join_time, id'))
+    connection.execute(text(
+        "INSERT INTO user_search (rowid, name) "
+        "SELECT user_search_keys.rowid, coalesce(users.name, '') FROM user_search_keys "
+        "JOIN users ON users.id = user_search_keys.user_id"))
+    # one b-tree per trigram instead of one per insert batch
+    connection.execute(text("INSERT INTO user_search (user_search) VALUES ('optimize')"))
+
+@event.listens_for(Base.metadata, 'after_create')
+def on_create_all(target, connection, **kwargs):
+    # the events below need the tables as soon as a user is added, even in a database made by create_all
+    create_user_search_tables(connection)
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_delete')
+def on_user_change(mapper, connection, user):
+    index_user(connection, user.id)
+
+@event.listens_for(User, 'after_update')
+def on_user_update(mapper, connection, user):
+    # users are updated on every score for their stat sums; only a rename touches the index
+    if inspect(user).attrs.name.history.has_changes():
+        index_user(connection, user.id)
+
+def prefix_query(session, search_query, limit):
+    return session.query(User.id).filter(User.name.like(escape_like(search_query) + '%', escape='\\')) \
+        .order_by(User.name.collate('NOCASE')).limit(limit)
+
+def search_users(session, search_query, limit=DEFAULT_SEARCH_LIMIT):
+    '''
+    ids of users whose name contains search_query (ignoring case), best first,
+    or None if the query is blank
+    infix matches come in the order users joined
+    '''
+    search_query = search_query.strip()
+    if not search_query:
+        return None
+    ids = [id for id, in prefix_query(session, search_query, limit)]
+    if len(ids) == limit or len(search_query) < TRIGRAM:
+        return ids
+    phrase = '"' + search_query.replace('"', '""') + '"'
+    # prefix matches are also infix matches, so skip past as many as there could be
+    rows = session.execute(text(
+        'SELECT user_search_keys.user_id FROM user_search '
+        'JOIN user_search_keys ON user_search_keys.rowid = user_search.rowid '
+        'WHERE user_search MATCH :phrase LIMIT :limit'),
+        { 'phrase': phrase, 'limit': limit + len(ids) })
+    found = set(ids)
+    ids += [id for id, in rows if id not in found]
+    return ids[:limit]
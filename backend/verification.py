@@ -0,0 +1,89 @@
+'''
+recomputes submitted scores from their replays in a process pool
+REPLAY_VERIFICATION picks what new_score does with the result:
+    off: don't verify
+    flag: save the score right away, then set Score.replay_verified once the replay is checked
+    reject: check before saving and refuse scores that don't match
+replays are simulated with the gameplay config sent with the score; without one (older clients) they're
+simulated with kana.DEFAULT_CONFIG, which can't tell a cheat from custom settings, so reject only flags those
+a replay that can't be checked (the pool is broken, the check fails or times out) saves its score
+with replay_verified false rather than failing the request
+'''
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import os
+from threading import Lock
+
+from beatmaputils import parse_beatmap
+from gameplayutils import simulate_replay, get_score_multiplier, final_stats, deserialize_replay
+from kana import DEFAULT_CONFIG
+
+VERIFICATION_MODE = os.environ.get('REPLAY_VERIFICATION', 'flag')
+VERIFICATION_WORKERS = int(os.environ.get('REPLAY_VERIFICATION_WORKERS', os.cpu_count() or 1))
+VERIFICATION_TIMEOUT = float(os.environ.get('REPLAY_VERIFICATION_TIMEOUT', 10))
+
+# replay timestamps are rounded to the ms before upload, which nudges timing judgements a little
+SCORE_TOLERANCE = 0.01 # relative
+ACCURACY_TOLERANCE = 0.01 # absolute
+
+_executor = None
+_executor_lock = Lock()
+
+def get_executor():
+    # created lazily so gunicorn workers each get their own pool after forking
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=VERIFICATION_WORKERS)
+        return _executor
+
+def reset_executor(broken):
+    # once a pool process dies (e.g. killed for running out of memory) the pool refuses every submit,
+    # so the next one gets a new pool
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+def recompute_stats(content, duration, base_key_score, speed_modification, mod_flag, replay_data, config=DEFAULT_CONFIG):
+    lines = parse_beatmap(content, duration)['lines']
+    score_multiplier = get_score_multiplier(speed_modification or 1, mod_flag or 0)
+    game_state = simulate_replay(lines, base_key_score, score_multiplier, deserialize_replay(replay_data), config)
+    return final_stats(game_state)
+
+def stats_match(claimed, recomputed):
+    if abs(claimed['score'] - recomputed['score']) > SCORE_TOLERANCE * max(recomputed['score'], 1):
+        return False
+    for key in ('key_accuracy', 'kana_accuracy'):
+        if recomputed[key] is None:
+            continue
+        if claimed[key] is None or abs(claimed[key] - recomputed[key]) > ACCURACY_TOLERANCE:
+            return False
+    return True
+
+def verify_score(content, duration, base_key_score, speed_modification, mod_flag, replay_data, config, claimed):
+    '''
+    runs in a pool process, so takes plain values instead of model objects
+    returns (whether claimed matches the replay, the recomputed stats)
+    '''
+    recomputed = recompute_stats(content, duration, base_key_score, speed_modification, mod_flag, replay_data, config)
+    return stats_match(claimed, recomputed), recomputed
+
+def submit_verification(beatmap, score, replay_data, config=None):
+    '''
+    config as gameplay_config_schema loads it, or None for kana.DEFAULT_CONFIG
+    '''
+    claimed = {
+        'score': score.score,
+        'key_accuracy': score.key_accuracy,
+        'kana_accuracy': score.kana_accuracy,
+    }
+    args = (beatmap.content, beatmap.duration, beatmap.base_key_score, score.speed_modification, score.mod_flag,
+            replay_data, config or DEFAULT_CONFIG, claimed)
+    executor = get_executor()
+    try:
+        return executor.submit(verify_score, *args)
+    except BrokenProcessPool:
+        reset_executor(executor)
+        return get_executor().submit(verify_score, *args)
@@ -0,0 +1,100 @@
+'''
+every database write goes through one writer thread per process, which owns that process's write connection
+handlers pass run_write a unit: a function that uses db_session as usual and returns its result
+the writer runs whatever units are queued together in one transaction, each in its own savepoint,
+and commits once for all of them, so concurrent score submissions share a single fsync
+
+units run on the writer thread, so they can't touch flask's request or session, and shouldn't commit
+whatever they return should already be serialized, since their objects expire at the commit
+'''
+from concurrent.futures import Future, TimeoutError
+import os
+from queue import Empty, Queue
+from threading import Lock, Thread
+from time import monotonic
+
+from database import db_session, engine
+
+WRITE_BATCH_SIZE = int(os.environ.get('WRITE_BATCH_SIZE', 64))
+# how long to hold a batch open for more units, in ms; 0 only groups what piled up during the last commit
+WRITE_BATCH_WINDOW = float(os.environ.get('WRITE_BATCH_WINDOW', 0)) / 1000
+# how long to wait for the writer to pick a unit up; once it has, the unit may commit, so we see it through
+WRITE_TIMEOUT = float(os.environ.get('WRITE_TIMEOUT', 30))
+
+_queue = Queue()
+_lock = Lock()
+_writer_pid = None
+
+def submit(unit):
+    '''
+    queues unit for the writer; returns a Future for what it returns (or raises)
+    '''
+    global _writer_pid
+    with _lock:
+        if _writer_pid != os.getpid(): # not started yet, or we're a fork and it didn't come along
+            _writer_pid = os.getpid()
+            Thread(target=_run, name='db-writer', daemon=True).start()
+    future = Future()
+    _queue.put((unit, future))
+    return future
+
+def run_write(unit):
+    '''
+    submit, then wait for the result
+    raises TimeoutError only if the writer didn't get to unit within WRITE_TIMEOUT, in which case it never runs
+    '''
+    # reads this thread already made might hold a lock the writer needs
+    db_session.close()
+    future = submit(unit)
+    try:
+        return future.result(timeout=WRITE_TIMEOUT)
+    except TimeoutError:
+        # a unit that's already running can still commit, and reporting that as a failure
+        # gets it submitted again (a score saved twice), so only give up on ones that haven't started
+        if future.cancel():
+            raise
+        return future.result()
+
+def next_batch():
+    batch = [_queue.get()]
+    deadline = monotonic() + WRITE_BATCH_WINDOW
+    while len(batch) < WRITE_BATCH_SIZE:
+        try:
+            batch.append(_queue.get(timeout=max(0, deadline - monotonic())) if WRITE_BATCH_WINDOW else _queue.get_nowait())
+        except Empty:
+            break
+    return batch
+
+def run_batch(batch):
+    done = []
+    for unit, future in batch:
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            with db_session.begin_nested():
+                result = unit()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            done.append((future, result))
+    try:
+        db_session.commit()
+    except BaseException as e:
+        db_session.rollback()
+        for future, _ in done:
+            future.set_exception(e)
+    else:
+        for future, result in done:
+            future.set_result(result)
+
+def _run():
+    # BEGIN IMMEDIATE takes the write lock up front, so writers in other processes
+    # wait on busy_timeout instead of failing to upgrade a read lock
+    connection = engine.connect().execution_options(sqlite_begin='BEGIN IMMEDIATE')
+    db_session(bind=connection)
+    while True:
+        batch = next_batch()
+        try:
+            run_batch(batch)
+        finally:
+            db_session.expunge_all()
@@ -20,7 +20,7 @@ import SettingsPage from "@/components/pages/Settings";
 
 import { getL10nFunc } from "@/providers/l10n";
 
-import { get, post } from "@/utils/functions";
+import { get, post, postRetryingWhenBusy } from "@/utils/functions";
 import { User } from "@/utils/types";
 
 import styled from 'styled-components';
@@ -86,8 +86,12 @@ const App = ({} : Props) => {
   }, []);
 
   const handleLogin = (code: string|null, state: string|null, oauthprovider: string) => {
-    post(`/api/login/${oauthprovider}/authorize`, { code, state }).then((user) => {
+    // the backend turns logins away with 503 while too many wait on the same provider
+    postRetryingWhenBusy(`/api/login/${oauthprovider}/authorize`, { code, state }).then((user) => {
       setUser(user);
+    }).catch((error) => {
+      console.log(error);
+      setUser(null);
     });
   };
 
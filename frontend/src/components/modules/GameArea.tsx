@@ -124,6 +124,11 @@ const GameArea = ({ user, beatmap, afterGameEnd, setAvailableSpeeds, speed, modC
       // if kana keyboard is allowed to submit
       // server will also need to store useKanaKeyboard
       replay_data: serializeReplay(keyLog),
+      // the backend replays keyLog with these to check the score
+      gameplay_config: {
+        type_polygraphs: config.typePolygraphs,
+        kana_spellings: config.kanaSpellings,
+      },
     }
     post('/api/scores', data).then((score) => {
       afterGameEnd();
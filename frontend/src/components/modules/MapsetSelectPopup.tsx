@@ -6,7 +6,7 @@ import { Container as ConfirmContainer } from "@/components/modules/ConfirmPopup
 
 import { getL10nElementFunc, getL10nFunc } from '@/providers/l10n';
 
-import { get } from "@/utils/functions";
+import { getAllPages } from "@/utils/functions";
 import { Beatmapset, MapsetID, User } from "@/utils/types";
 
 import '@/utils/styles.css'
@@ -68,8 +68,7 @@ const MapsetSelectPopup = ({ user, button, onSelect }: Props) => {
   const selectedMapset = mapsets?.filter(mapset => mapset.id === selectedMapsetId).at(0);
 
   useEffect(() => {
-    get("/api/beatmapsets", { search: user?.id }).then((res) => {
-      const beatmapsets = res.beatmapsets;
+    getAllPages("/api/beatmapsets", "beatmapsets", { owner: user?.id }).then((beatmapsets) => {
       if (beatmapsets && beatmapsets.length) {
         setMapsets(beatmapsets);
       } else {
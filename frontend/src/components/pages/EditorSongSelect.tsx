@@ -6,7 +6,7 @@ import Loading from "@/components/modules/Loading";
 
 import { getL10nFunc } from '@/providers/l10n';
 
-import { get } from "@/utils/functions";
+import { getAllPages } from "@/utils/functions";
 import { User, Beatmapset } from "@/utils/types";
 import { sortFuncs } from "@/components/pages/SongSelect";
 import { withLabel } from "@/utils/componentutils";
@@ -43,8 +43,7 @@ const EditorSongSelect = ({ user } : Props) => {
   filteredMapsets?.sort(sortFunc);
 
   const getBeatmapsets = () => {
-    get("/api/beatmapsets", { search: user?.id }).then((res) => {
-      const beatmapsets = res.beatmapsets;
+    getAllPages("/api/beatmapsets", "beatmapsets", { owner: user?.id }).then((beatmapsets) => {
       if (beatmapsets && beatmapsets.length) {
         setMapsets(beatmapsets);
       } else {
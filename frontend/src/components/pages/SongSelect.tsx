@@ -6,7 +6,7 @@ import Loading from "@/components/modules/Loading";
 import { getL10nFunc } from '@/providers/l10n';
 import { Config } from "@/providers/config";
 
-import { get } from "@/utils/functions";
+import { getAllPages } from "@/utils/functions";
 import { Beatmapset, Beatmap, BeatmapMetadata, User } from "@/utils/types";
 import { withLabel } from "@/utils/componentutils";
 import { getSetAvg } from "@/utils/beatmaputils";
@@ -70,8 +70,7 @@ const SongSelect = ({user} : Props) => {
   filteredMapsets?.sort(sortFunc);
 
   const getBeatmapsets = () => {
-    get("/api/beatmapsets").then((res) => {
-      const beatmapsets = res.beatmapsets;
+    getAllPages("/api/beatmapsets", "beatmapsets").then((beatmapsets) => {
       if (beatmapsets && beatmapsets.length) {
         setMapsets(beatmapsets);
       } else {
@@ -47,6 +47,24 @@ export function get(endpoint, params = {}) {
     });
 }
 
+// the most a list endpoint returns per page (MAX_PAGE_SIZE in backend/api.py)
+const MAX_PAGE_SIZE = 200;
+
+// Helper code to fetch every page of a paginated list endpoint, following its "next" cursors.
+// Pages are as large as the backend allows, so most lists are still a single request.
+// Returns a Promise to the concatenated list under key, e.g. getAllPages('/api/beatmapsets', 'beatmapsets')
+export async function getAllPages(endpoint, key, params = {}) {
+  let items = [];
+  let after = undefined;
+  const pageParams = { limit: MAX_PAGE_SIZE, ...params };
+  do {
+    const res = await get(endpoint, after ? { ...pageParams, after } : pageParams);
+    items = items.concat(res[key] ?? []);
+    after = res.next;
+  } while (after);
+  return items;
+}
+
 // Helper code to make a post request. Default parameter of empty JSON Object for params.
 // Returns a Promise to a JSON Object.
 export function post(endpoint, params = {}) {
@@ -89,3 +107,23 @@ export async function httpDelete(endpoint, params = {}) {
     throw `DELETE request to ${endpoint} failed with error:\n${error}`;
   }
 }
+
+// Like post, but when the server is busy (503) it waits as long as its Retry-After asks and tries again,
+// up to retries times. Only for endpoints that refuse busy requests before doing anything,
+// e.g. login authorize, whose single use code is still unspent after a 503.
+export async function postRetryingWhenBusy(endpoint, params = {}, retries = 5) {
+  for (let attempt = 0; ; attempt++) {
+    const res = await fetch(endpoint, {
+      method: "post",
+      headers: { "Content-type": "application/json" },
+      body: JSON.stringify(params),
+    }).catch((error) => {
+      throw `POST request to ${endpoint} failed with error:\n${error}`;
+    });
+    if (res.status != 503 || attempt >= retries) {
+      return convertToJSON(res);
+    }
+    const seconds = Number(res.headers.get("Retry-After")) || 1;
+    await new Promise((resolve) => setTimeout(resolve, seconds * 1000));
+  }
+}
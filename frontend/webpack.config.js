@@ -9,7 +9,7 @@ module.exports = {
   output: {
     path: outputDir,
     publicPath: "/static/",
-    filename: 'bundle.js',
+    filename: 'bundle.[contenthash].js', // hashed, so the backend can serve it as immutable
     clean: true,
   },
   resolve: {